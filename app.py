@@ -5,11 +5,17 @@ from dash.dependencies import Input, Output
 
 import pandas as pd
 import numpy as np
+from pyarrow import feather
 from datetime import datetime
+import functools
+import json
 
 import plotly
 import plotly.graph_objects as go
 
+import schema
+import hierarchy
+
 
 app = dash.Dash(__name__)
 server = app.server
@@ -25,14 +31,44 @@ dash_colors = {
     'green': '#5bc246'
 }
 
-df_worldwide = pd.read_csv('data/df_worldwide.csv')
-df_worldwide['percentage'] = df_worldwide['percentage'].astype(str)
-df_worldwide['date'] = pd.to_datetime(df_worldwide['date'])
+def load(name):
+    '''
+    memory-maps a processed output written by etl.py; the file already holds
+    native dates and categorical region names, so nothing is parsed or copied
+    '''
+    return feather.read_table('data/df_{}.feather'.format(name), memory_map=True).to_pandas(split_blocks=True)
+
+# the outputs hold only dates, region ids and metrics; the names, coordinates
+# and populations of the regions are looked up in the regions table
+regions = load('regions').set_index('region_id')
+# the unassigned recoveries already count towards the states' population
+regions['population'] = regions['population'].where((regions['view'] != 'us') | (regions['Country/Region'] != 'Recovered'), 0)
+
+views = {'Worldwide': 'worldwide',
+         'United States': 'us',
+         'Europe': 'eu',
+         'China': 'china'}
+
+def region_ids(view, names):
+    '''
+    returns the ids of the named regions of a dashboard view and of the named
+    custom region groups
+    '''
+    return regions.index[regions['view'].isin([views.get(view, 'worldwide'), 'groups']) & regions['Country/Region'].isin(names)]
+
+def with_regions(df, columns):
+    '''
+    adds columns of the regions table to the rows of an output
+    '''
+    rows = regions.index.get_indexer(df['region_id'])
+    return df.assign(**{column: regions[column].to_numpy()[rows] for column in columns})
+
+df_worldwide = load('worldwide')
 
 # selects the "data last updated" date
 update = df_worldwide['date'].dt.strftime('%B %d, %Y').iloc[-1]
 
-available_countries = sorted(df_worldwide['Country/Region'].unique())
+available_countries = sorted(regions.loc[np.unique(df_worldwide['region_id']), 'Country/Region'].unique())
 
 states = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California',
           'Colorado', 'Connecticut', 'Delaware', 'District of Columbia',
@@ -46,17 +82,6 @@ states = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California',
           'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington',
           'West Virginia', 'Wisconsin', 'Wyoming']
 
-eu = ['Albania', 'Andorra', 'Austria', 'Belarus', 'Belgium',
-      'Bosnia and Herzegovina', 'Bulgaria', 'Croatia', 'Cyprus',
-      'Czech Republic', 'Denmark', 'Estonia', 'Finland', 'France',
-      'Germany', 'Greece', 'Hungary', 'Iceland', 'Ireland', 'Italy',
-      'Kosovo', 'Latvia', 'Liechtenstein', 'Lithuania', 'Luxembourg',
-      'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands',
-      'North Macedonia', 'Norway', 'Poland', 'Portugal', 'Romania',
-      'San Marino', 'Serbia', 'Slovakia', 'Slovenia', 'Spain', 'Sweden',
-      'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
-      'Vatican City']
-
 china = ['Anhui', 'Beijing', 'Chongqing', 'Fujian', 'Gansu', 'Guangdong',
          'Guangxi', 'Guizhou', 'Hainan', 'Hebei', 'Heilongjiang', 'Henan',
          'Hong Kong', 'Hubei', 'Hunan', 'Inner Mongolia', 'Jiangsu',
@@ -64,93 +89,79 @@ china = ['Anhui', 'Beijing', 'Chongqing', 'Fujian', 'Gansu', 'Guangdong',
          'Shaanxi', 'Shandong', 'Shanghai', 'Shanxi', 'Sichuan', 'Tianjin',
          'Tibet', 'Xinjiang', 'Yunnan', 'Zhejiang']
 
-region_options = {'Worldwide': available_countries,
-                  'United States': states,
-                  'Europe': eu,
-                  'China': china}
-
-df_us = pd.read_csv('data/df_us.csv')
-df_us['percentage'] = df_us['percentage'].astype(str)
-df_us['date'] = pd.to_datetime(df_us['date'])
+# the custom region groups are offered alongside the regions of the view
+# their members are drawn from
+groups = pd.read_csv('data/groups.csv').drop_duplicates('group')
 
-df_eu = pd.read_csv('data/df_eu.csv')
-df_eu['percentage'] = df_eu['percentage'].astype(str)
-df_eu['date'] = pd.to_datetime(df_eu['date'])
+def view_groups(view):
+    return sorted(groups.loc[groups['view'] == views[view], 'group'])
 
-df_china = pd.read_csv('data/df_china.csv')
-df_china['percentage'] = df_china['percentage'].astype(str)
-df_china['date'] = pd.to_datetime(df_china['date'])
+region_options = {'Worldwide': available_countries + view_groups('Worldwide'),
+                  'United States': states + view_groups('United States'),
+                  'Europe': hierarchy.EUROPE + view_groups('Europe'),
+                  'China': china + view_groups('China')}
 
-df_us_counties = pd.concat([pd.read_csv('data/df_us_county1.csv'),
-                            pd.read_csv('data/df_us_county2.csv'),
-                            pd.read_csv('data/df_us_county3.csv'),
-                            pd.read_csv('data/df_us_county4.csv')], ignore_index=True)
-df_us_counties['percentage'] = df_us_counties['percentage'].astype(str)
-df_us_counties['Country/Region'] = df_us_counties['Country/Region'].astype(str)
-df_us_counties['date'] = pd.to_datetime(df_us_counties['date'])
+df_us = load('us')
+df_eu = load('eu')
+df_china = load('china')
+df_groups = load('groups')
 
-@app.callback(
-    Output('confirmed_ind', 'figure'),
-    [Input('global_format', 'value')])
-def confirmed(view):
+def map_points(df):
     '''
-    creates the CUMULATIVE CONFIRMED indicator
+    splits an output into the points the map shows on each of its dates, in
+    the order of the dates, with their hover text and marker sizes
     '''
-    if view == 'Worldwide':
-        df = df_worldwide
-    elif view == 'United States':
-        df = df_us
-    elif view == 'Europe':
-        df = df_eu
-    elif view == 'China':
-        df = df_china
-    else:
-        df = df_worldwide
+    date_index, _ = pd.factorize(df['date'])
+    shown = (df['Confirmed'] > 0).to_numpy()
+    df = with_regions(df[shown], ['Country/Region', 'Latitude', 'Longitude'])
+    df = df.assign(text=df['Country/Region'].astype(str) + ': ' +\
+                        ['{:,}'.format(i) for i in df['Confirmed']] +\
+                        ' total cases, ' + schema.percentage_labels(df['share_of_last_week']) +\
+                        '% from previous week',
+                   size=np.sqrt(df['Confirmed']))
+    points = dict(list(df.groupby(date_index[shown])))
+    return [points.get(i, df.iloc[:0]) for i in range(date_index.max() + 1)]
 
-    value = df[df['date'] == df['date'].iloc[-1]]['Confirmed'].sum()
-    delta = df[df['date'] == df['date'].unique()[-2]]['Confirmed'].sum()
-    return {
-            'data': [{'type': 'indicator',
-                    'mode': 'number+delta',
-                    'value': value,
-                    'delta': {'reference': delta,
-                              'valueformat': ',g',
-                              'relative': False,
-                              'increasing': {'color': dash_colors['blue']},
-                              'decreasing': {'color': dash_colors['green']},
-                              'font': {'size': 25}},
-                    'number': {'valueformat': ',',
-                              'font': {'size': 50}},
-                    'domain': {'y': [0, 1], 'x': [0, 1]}}],
-            'layout': go.Layout(
-                title={'text': "CUMULATIVE CONFIRMED"},
-                font=dict(color=dash_colors['red']),
-                paper_bgcolor=dash_colors['background'],
-                plot_bgcolor=dash_colors['background'],
-                height=200
-                )
-            }
+# the map is moved along the dates with the slider, so its points are split
+# by date once rather than filtered out of the whole output on every move
+view_points = {view: map_points(df) for view, df in [('Worldwide', df_worldwide), ('Europe', df_eu),
+                                                       ('China', df_china)]}
 
-@app.callback(
-    Output('active_ind', 'figure'),
-    [Input('global_format', 'value')])
-def active(view):
+# the county data is partitioned by month; only the months the map is moved
+# to are loaded, and only a few of them are kept in memory
+with open('data/df_us_county/manifest.json') as f:
+    county_partitions = sorted(json.load(f)['partitions'].items())
+
+@functools.lru_cache(maxsize=4)
+def load_county_partition(month):
+    return map_points(load('us_county/{}'.format(month)))
+
+def county_points(date_index):
     '''
-    creates the CURRENTLY ACTIVE indicator
+    returns the map points of the date_index-th date of the county data from
+    the partition holding it
+    '''
+    for month, partition in county_partitions:
+        if date_index < partition['dates']:
+            break
+        date_index -= partition['dates']
+    return load_county_partition(month)[date_index]
+
+# the totals of each view on each date of the slider, so the indicators are
+# looked up rather than summed over the whole output whenever the view or the
+# date changes
+indicators = {'Confirmed': 'CUMULATIVE CONFIRMED',
+              'Active': 'CURRENTLY ACTIVE',
+              'Recovered': 'RECOVERED CASES',
+              'Deaths': 'DEATHS TO DATE'}
+totals = {view: df.groupby('date')[list(indicators)].sum().reindex(df_worldwide['date'].unique(), fill_value=0)
+          for view, df in [('Worldwide', df_worldwide), ('United States', df_us),
+                           ('Europe', df_eu), ('China', df_china)]}
+
+def indicator(title, value, delta):
+    '''
+    creates an indicator of a value and its change from the day before
     '''
-    if view == 'Worldwide':
-        df = df_worldwide
-    elif view == 'United States':
-        df = df_us
-    elif view == 'Europe':
-        df = df_eu
-    elif view == 'China':
-        df = df_china
-    else:
-        df = df_worldwide
-
-    value = df[df['date'] == df['date'].iloc[-1]]['Active'].sum()
-    delta = df[df['date'] == df['date'].unique()[-2]]['Active'].sum()
     return {
             'data': [{'type': 'indicator',
                     'mode': 'number+delta',
@@ -165,7 +176,7 @@ def active(view):
                               'font': {'size': 50}},
                     'domain': {'y': [0, 1], 'x': [0, 1]}}],
             'layout': go.Layout(
-                title={'text': "CURRENTLY ACTIVE"},
+                title={'text': title},
                 font=dict(color=dash_colors['red']),
                 paper_bgcolor=dash_colors['background'],
                 plot_bgcolor=dash_colors['background'],
@@ -174,53 +185,28 @@ def active(view):
             }
 
 @app.callback(
-    Output('recovered_ind', 'figure'),
-    [Input('global_format', 'value')])
-def recovered(view):
+    [Output('confirmed_ind', 'figure'),
+     Output('active_ind', 'figure'),
+     Output('recovered_ind', 'figure'),
+     Output('deaths_ind', 'figure')],
+    [Input('global_format', 'value'),
+     Input('date_slider', 'value')])
+def indicator_row(view, date_index):
     '''
-    creates the RECOVERED CASES indicator
+    creates the CUMULATIVE CONFIRMED, CURRENTLY ACTIVE, RECOVERED CASES and
+    DEATHS TO DATE indicators for the date of the slider
     '''
-    if view == 'Worldwide':
-        df = df_worldwide
-    elif view == 'United States':
-        df = df_us
-    elif view == 'Europe':
-        df = df_eu
-    elif view == 'China':
-        df = df_china
-    else:
-        df = df_worldwide
+    df = totals.get(view, totals['Worldwide'])
+    # the first date has no day before it to change from
+    value, delta = df.iloc[date_index], df.iloc[max(date_index - 1, 0)]
+    return [indicator(title, value[column], delta[column]) for column, title in indicators.items()]
 
-    value = df[df['date'] == df['date'].iloc[-1]]['Recovered'].sum()
-    delta = df[df['date'] == df['date'].unique()[-2]]['Recovered'].sum()
-    return {
-            'data': [{'type': 'indicator',
-                    'mode': 'number+delta',
-                    'value': value,
-                    'delta': {'reference': delta,
-                              'valueformat': ',g',
-                              'relative': False,
-                              'increasing': {'color': dash_colors['blue']},
-                              'decreasing': {'color': dash_colors['green']},
-                              'font': {'size': 25}},
-                    'number': {'valueformat': ',',
-                              'font': {'size': 50}},
-                    'domain': {'y': [0, 1], 'x': [0, 1]}}],
-            'layout': go.Layout(
-                title={'text': "RECOVERED CASES"},
-                font=dict(color=dash_colors['red']),
-                paper_bgcolor=dash_colors['background'],
-                plot_bgcolor=dash_colors['background'],
-                height=200
-                )
-            }
-
-@app.callback(
-    Output('deaths_ind', 'figure'),
-    [Input('global_format', 'value')])
-def deaths(view):
+@functools.lru_cache(maxsize=8)
+def trend(view, population):
     '''
-    creates the DEATHS TO DATE indicator
+    returns the totals of a view by date, or with population='percent' the
+    totals per 100,000 people of the regions whose population is known. There
+    are only a few views and the data is loaded once, so each is summed once.
     '''
     if view == 'Worldwide':
         df = df_worldwide
@@ -233,29 +219,12 @@ def deaths(view):
     else:
         df = df_worldwide
 
-    value = df[df['date'] == df['date'].iloc[-1]]['Deaths'].sum()
-    delta = df[df['date'] == df['date'].unique()[-2]]['Deaths'].sum()
-    return {
-            'data': [{'type': 'indicator',
-                    'mode': 'number+delta',
-                    'value': value,
-                    'delta': {'reference': delta,
-                              'valueformat': ',g',
-                              'relative': False,
-                              'increasing': {'color': dash_colors['blue']},
-                              'decreasing': {'color': dash_colors['green']},
-                              'font': {'size': 25}},
-                    'number': {'valueformat': ',',
-                              'font': {'size': 50}},
-                    'domain': {'y': [0, 1], 'x': [0, 1]}}],
-            'layout': go.Layout(
-                title={'text': "DEATHS TO DATE"},
-                font=dict(color=dash_colors['red']),
-                paper_bgcolor=dash_colors['background'],
-                plot_bgcolor=dash_colors['background'],
-                height=200
-                )
-            }
+    columns = ['Confirmed', 'Active', 'Recovered', 'Deaths']
+    if population == 'percent':
+        df = with_regions(df, ['population']).dropna(subset=['population'])
+        df = df.groupby('date')[columns + ['population']].sum()
+        return df[columns].div(df['population'], axis=0)
+    return df.groupby('date')[columns].sum()
 
 @app.callback(
     Output('worldwide_trend', 'figure'),
@@ -265,65 +234,20 @@ def worldwide_trend(view, population):
     '''
     creates the upper-left chart (aggregated stats for the view)
     '''
-    if view == 'Worldwide':
-        df = df_worldwide
-    elif view == 'United States':
-        df = df_us
-        df_us.loc[df_us['Country/Region'] == 'Recovered', ['population']] = 0
-    elif view == 'Europe':
-        df = df_eu
-    elif view == 'China':
-        df = df_china
-    else:
-        df = df_worldwide
-
-    if population == 'absolute':
-        confirmed = df.groupby('date')['Confirmed'].sum()
-        active = df.groupby('date')['Active'].sum()
-        recovered = df.groupby('date')['Recovered'].sum()
-        deaths = df.groupby('date')['Deaths'].sum()
-        title_suffix = ''
-        hover = '%{y:,g}'
-    elif population == 'percent':
-        df = df.dropna(subset=['population'])
-        confirmed = df.groupby('date')['Confirmed'].sum() / df.groupby('date')['population'].sum()
-        active = df.groupby('date')['Active'].sum() / df.groupby('date')['population'].sum()
-        recovered = df.groupby('date')['Recovered'].sum() / df.groupby('date')['population'].sum()
-        deaths = df.groupby('date')['Deaths'].sum() / df.groupby('date')['population'].sum()
+    df = trend(view, population)
+    if population == 'percent':
         title_suffix = ' per 100,000 people'
         hover = '%{y:,.2f}'
     else:
-        confirmed = df.groupby('date')['Confirmed'].sum()
-        active = df.groupby('date')['Active'].sum()
-        recovered = df.groupby('date')['Recovered'].sum()
-        deaths = df.groupby('date')['Deaths'].sum()
         title_suffix = ''
         hover = '%{y:,g}'
 
     traces = [go.Scatter(
-                    x=df.groupby('date')['date'].first(),
-                    y=confirmed,
-                    hovertemplate=hover,
-                    name="Confirmed",
-                    mode='lines'),
-                go.Scatter(
-                    x=df.groupby('date')['date'].first(),
-                    y=active,
-                    hovertemplate=hover,
-                    name="Active",
-                    mode='lines'),
-                go.Scatter(
-                    x=df.groupby('date')['date'].first(),
-                    y=recovered,
-                    hovertemplate=hover,
-                    name="Recovered",
-                    mode='lines'),
-                go.Scatter(
-                    x=df.groupby('date')['date'].first(),
-                    y=deaths,
+                    x=df.index,
+                    y=df[column],
                     hovertemplate=hover,
-                    name="Deaths",
-                    mode='lines')]
+                    name=column,
+                    mode='lines') for column in df.columns]
     return {
             'data': traces,
             'layout': go.Layout(
@@ -366,6 +290,32 @@ def set_countries_value(view, available_options):
     else:
         return ['US', 'Italy', 'United Kingdom', 'Spain', 'France', 'Germany', 'Russia']
 
+def region_series(df):
+    '''
+    splits an output into the date-indexed series of each of its regions,
+    keyed by region_id, with the values per 100,000 people alongside; returns
+    them with each region's confirmed cases on the output's last date
+    '''
+    columns = list(indicators)
+    df = with_regions(df, ['population'])
+    df = df[['date', 'region_id'] + columns].join(df[columns].div(df['population'], axis=0), rsuffix=' per 100,000')
+    latest = df.loc[df['date'] == df['date'].max()].set_index('region_id')['Confirmed']
+    return {region: rows.set_index('date') for region, rows in df.groupby('region_id')}, latest
+
+# the series of every region of the views and of the custom groups, so each
+# selected region is a single lookup, and the latest confirmed cases which
+# rank them; region ids are unique across the outputs
+series, latest = {}, []
+for df in [df_worldwide, df_us, df_eu, df_china, df_groups]:
+    store, ranking = region_series(df)
+    series.update(store)
+    latest.append(ranking)
+latest = pd.concat(latest).sort_index()
+# the recoveries which the US data doesn't assign to a state
+unidentified = {view: df[df['region_id'].isin(region_ids(view, ['Recovered']))].groupby('date')[list(indicators)].sum()
+                for view, df in [('Worldwide', df_worldwide), ('United States', df_us),
+                                 ('Europe', df_eu), ('China', df_china)]}
+
 @app.callback(
     Output('active_countries', 'figure'),
     [Input('global_format', 'value'),
@@ -376,51 +326,37 @@ def active_countries(view, countries, column, population):
     '''
     creates the upper-right chart (sub-region analysis)
     '''
-    if view == 'Worldwide':
-        df = df_worldwide
-    elif view == 'United States':
-        df = df_us
-    elif view == 'Europe':
-        df = df_eu
-    elif view == 'China':
-        df = df_china
-    else:
-        df = df_worldwide
-
-    if population == 'absolute':
-        column_label = column
-        hover = '%{y:,g}<br>%{x}'
-    elif population == 'percent':
+    selected = region_ids(view, countries)
+    recovered = unidentified.get(view, unidentified['Worldwide'])[column]
+    if population == 'percent':
         column_label = '{} per 100,000'.format(column)
-        df = df.dropna(subset=['population'])
+        selected = selected[regions.loc[selected, 'population'].notna().to_numpy()]
         hover = '%{y:,.2f}<br>%{x}'
     else:
         column_label = column
         hover = '%{y:,g}<br>%{x}'
 
     traces = []
-    countries = df[(df['Country/Region'].isin(countries)) &
-                   (df['date'] == df['date'].max())].groupby('Country/Region')['Confirmed'].sum().sort_values(ascending=False).index.to_list()
-    for country in countries:
-        if population == 'absolute':
-            y_data = df[df['Country/Region'] == country].groupby('date')[column].sum()
-            recovered = df[df['Country/Region'] == 'Recovered'].groupby('date')[column].sum()
-        elif population == 'percent':
-            y_data = df[df['Country/Region'] == country].groupby('date')[column].sum() / df[df['Country/Region'] == country].groupby('date')['population'].first()
-            recovered = df[df['Country/Region'] == 'Recovered'].groupby('date')[column].sum() / df[df['Country/Region'] == country].groupby('date')['population'].first()
+    countries = latest.reindex(selected).dropna().sort_values(ascending=False).index.to_list()
+    for region in countries:
+        df = series[region]
+        if population == 'percent':
+            y_data = df[column_label]
         else:
-            y_data = df[df['Country/Region'] == country].groupby('date')[column].sum()
-            recovered = df[df['Country/Region'] == 'Recovered'].groupby('date')[column].sum()
+            y_data = df[column]
 
         traces.append(go.Scatter(
-                    x=df[df['Country/Region'] == country].groupby('date')['date'].first(),
+                    x=df.index,
                     y=y_data,
                     hovertemplate=hover,
-                    name=country,
+                    name=regions.at[region, 'Country/Region'],
                     mode='lines'))
-    if column == 'Recovered':
+    if column == 'Recovered' and countries:
+        if population == 'percent':
+            # shown on the scale of the last region in the chart
+            recovered = recovered / regions.at[countries[-1], 'population']
         traces.append(go.Scatter(
-                    x=df[df['Country/Region'] == 'Recovered'].groupby('date')['date'].first(),
+                    x=recovered.index,
                     y=recovered,
                     hovertemplate=hover,
                     name='Unidentified',
@@ -449,46 +385,42 @@ def world_map(view, date_index):
     creates the lower-left chart (map)
     '''
     if view == 'Worldwide':
-        df = df_worldwide
+        df = view_points['Worldwide'][date_index]
         scope = 'world'
         projection_type = 'natural earth'
         sizeref = 35
     elif view == 'United States':
         scope = 'usa'
         projection_type = 'albers usa'
-        df = df_us_counties
+        df = county_points(date_index)
         sizeref = 7
     elif view == 'Europe':
-        df = df_eu
+        df = view_points['Europe'][date_index]
         scope = 'europe'
         projection_type = 'natural earth'
         sizeref = 15
     elif view == 'China':
-        df = df_china
+        df = view_points['China'][date_index]
         scope = 'asia'
         projection_type = 'natural earth'
         sizeref = 3
     else:
-        df = df_worldwide
+        df = view_points['Worldwide'][date_index]
         scope = 'world'
         projection_type = 'natural earth',
         sizeref = 10
-    df = df[(df['date'] == df['date'].unique()[date_index]) & (df['Confirmed'] > 0)]
     return {
             'data': [
                 go.Scattergeo(
                     lon = df['Longitude'],
                     lat = df['Latitude'],
-                    text = df['Country/Region'] + ': ' +\
-                        ['{:,}'.format(i) for i in df['Confirmed']] +\
-                        ' total cases, ' + df['percentage'] +\
-                        '% from previous week',
+                    text = df['text'],
                     hoverinfo = 'text',
                     mode = 'markers',
                     marker = dict(reversescale = False,
                         autocolorscale = False,
                         symbol = 'circle',
-                        size = np.sqrt(df['Confirmed']),
+                        size = df['size'],
                         sizeref = sizeref,
                         sizemin = 0,
                         line = dict(width=.5, color='rgba(0, 0, 0)'),
@@ -555,8 +487,8 @@ def trajectory(view, date_index):
 
     date = df_worldwide['date'].unique()[date_index]
 
-    df = df.groupby(['date', 'Country/Region'], as_index=False)['Confirmed'].sum()
-    df['previous_week'] = df.groupby(['Country/Region'])['Confirmed'].shift(7, fill_value=0)
+    df = df.groupby(['date', 'region_id'], as_index=False)['Confirmed'].sum()
+    df['previous_week'] = df.groupby(['region_id'])['Confirmed'].shift(7, fill_value=0)
     df['new_cases'] = df['Confirmed'] - df['previous_week']
     df['new_cases'] = df['new_cases'].clip(lower=0)
 
@@ -565,20 +497,21 @@ def trajectory(view, date_index):
     ymax = np.log(1.25 * df['new_cases'].max()) / np.log(10)
     ymin = np.log(10)
 
-    countries_full = df.groupby(by='Country/Region', as_index=False)['Confirmed'].max().sort_values(by='Confirmed', ascending=False)['Country/Region'].to_list()
+    countries_full = df.groupby(by='region_id', as_index=False)['Confirmed'].max().sort_values(by='Confirmed', ascending=False)['region_id'].to_list()
     
     df = df[df['date'] <= date]
 
-    countries = df.groupby(by='Country/Region', as_index=False)['Confirmed'].max().sort_values(by='Confirmed', ascending=False)
-    countries = countries[countries['Confirmed'] > threshold]['Country/Region'].to_list()
+    countries = df.groupby(by='region_id', as_index=False)['Confirmed'].max().sort_values(by='Confirmed', ascending=False)
+    countries = countries[countries['Confirmed'] > threshold]['region_id'].to_list()
     countries = [country for country in countries_full if country in countries]
 
     traces = []
     trace_colors = plotly.colors.qualitative.D3
     color_idx = 0
 
-    for country in countries:
-        filtered_df = df[df['Country/Region'] == country].reset_index()
+    for region in countries:
+        country = regions.at[region, 'Country/Region']
+        filtered_df = df[df['region_id'] == region].reset_index()
         idx = filtered_df['Confirmed'].sub(threshold).gt(0).idxmax()
         trace_data = filtered_df[idx:].copy()
         trace_data['date'] = pd.to_datetime(trace_data['date'])
@@ -2,76 +2,178 @@ import pandas as pd
 import numpy as np
 import glob
 import re
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 import time
 import io
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from pyarrow import feather
+from scipy import sparse
 import sys
-
-
-def save_from_web(url):
-    url = r'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/{}'.format(url)
-    raw_string = requests.get(url).content
-    return pd.read_csv(io.StringIO(raw_string.decode('utf-8')))
-
-def load_time_series(source='web', update='manual'):
+import os
+import json
+import hashlib
+
+import schema
+import hierarchy
+
+
+BASE_URL = r'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/'
+TIME_SERIES_URL = r'{}csse_covid_19_time_series/'.format(BASE_URL)
+DAILY_REPORTS_URL = r'{}csse_covid_19_daily_reports/'.format(BASE_URL)
+DAILY_WORKERS = 8  # concurrent daily report downloads
+DAILY_STORE = 'data/daily'
+DAILY_SCHEMA = {'date': 'datetime64[ns]',
+                'Country/Region': 'object',
+                'Province/State': 'object',
+                'Admin2': 'object',
+                'FIPS': 'float64',
+                'Last Update': 'object',
+                'Latitude': 'float64',
+                'Longitude': 'float64',
+                'Confirmed': 'float64',
+                'Deaths': 'float64',
+                'Recovered': 'float64',
+                'Active': 'float64'}
+TIME_SERIES = ['confirmed_US', 'confirmed_global', 'deaths_US', 'deaths_global', 'recovered_global']
+TIMEOUT = (10, 120)  # (connect, read) seconds, applied to each file separately
+HEADER_BYTES = 65536  # enough for the header line of ~7000 date columns
+POLL_MIN = 60  # seconds between freshness probes right after a file updates
+POLL_MAX = 600  # seconds between freshness probes while nothing is changing
+CACHE_DIR = 'data/cache'
+CACHE_KEEP = 1  # entries kept per stage; older ones can never be hit again
+REFERENCE_FILES = ['data/geo_us.csv',
+                   'data/nst-est2019-alldata.csv',
+                   'data/AnnualbyProvince.csv',
+                   'data/overrides.csv']
+WPP_FILE = 'data/WPP2019_TotalPopulationBySex.csv'  # keyed through its cached extract, see wpp_extract
+WPP_CHUNK = 200000  # rows of the WPP file parsed at a time
+OVERRIDES_FILE = 'data/overrides.csv'  # per-region population names, populations and coordinates
+GROUPS_FILE = 'data/groups.csv'  # custom region groups, one row per member region
+REGION_KEYS = ['Country/Region', 'Province/State', 'Admin2']
+OUTPUTS = ['worldwide', 'us', 'eu', 'china', 'us_county', 'groups']
+OUTPUT_FILES = {'groups': [GROUPS_FILE]}  # files an output reads besides the raw data and REFERENCE_FILES
+OUTPUT_DEPENDENCIES = {'us_county': []}  # ['us'] when us_county is built with us_county_compressed
+PARTITIONED_OUTPUTS = ['us_county']  # stored as one file per month plus a manifest
+STREAMED_LEVELS = ['county']  # built and written a chunk at a time instead of being kept in the cube
+CHUNK_MONTHS = 3  # months of dates transformed at a time, which bounds the memory the county rows take
+REGION_ATTRIBUTES = ['Country/Region', 'Latitude', 'Longitude', 'population']  # kept in the regions table
+REGION_BLOCK = 100000  # the region ids of an output start at its position in OUTPUTS times this
+
+
+def web_session(retries=3, pool_size=len(TIME_SERIES)):
+    '''
+    returns a keep-alive session whose connections are pooled across threads
+    and which retries failed connections and 5xx responses with backoff
+    '''
+    retry = Retry(total=retries,
+                  backoff_factor=2,
+                  status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def save_from_web(url, session=None, base_url=BASE_URL, timeout=TIMEOUT):
+    url = r'{}{}'.format(base_url, url)
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    return pd.read_csv(io.StringIO(response.content.decode('utf-8')))
+
+def fetch_time_series(session=None, base_url=TIME_SERIES_URL, timeout=TIMEOUT, names=TIME_SERIES):
+    '''
+    downloads the time series files concurrently and returns them as a dict of
+    DataFrames keyed by name, e.g. 'confirmed_US'. Point base_url at a local
+    server (python -m http.server --directory data/raw) to run offline.
+    '''
+    session = session or web_session()
+    with ThreadPoolExecutor(max_workers=len(TIME_SERIES)) as executor:
+        futures = {name: executor.submit(save_from_web,
+                                         'time_series_covid19_{}.csv'.format(name),
+                                         session,
+                                         base_url,
+                                         timeout)
+                   for name in names}
+        return {name: futures[name].result() for name in names}
+
+def probe_time_series(name, session, probes, base_url=TIME_SERIES_URL, timeout=TIMEOUT):
+    '''
+    returns the newest date column of a time series file without downloading
+    the file. The validators from the previous probe are sent along so an
+    unchanged file costs a 304, otherwise only the header line is read from a
+    ranged, streamed response. probes holds the state between calls.
+    '''
+    url = r'{}time_series_covid19_{}.csv'.format(base_url, name)
+    headers = {'Range': 'bytes=0-{}'.format(HEADER_BYTES - 1)}
+    if name in probes:
+        if probes[name]['etag']:
+            headers['If-None-Match'] = probes[name]['etag']
+        if probes[name]['last_modified']:
+            headers['If-Modified-Since'] = probes[name]['last_modified']
+
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return probes[name]['date']
+        response.raise_for_status()
+        header = next(response.iter_lines()).decode('utf-8')
+
+    probes[name] = {'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'date': pd.to_datetime(header.split(',')[-1].strip())}
+    return probes[name]['date']
+
+def download_time_series(source='web', update='manual', base_url=TIME_SERIES_URL):
+    '''
+    returns the raw time series files as a dict of DataFrames keyed by name,
+    or 'end' if they could not be downloaded in time
+    '''
     if source == 'web':
-        today = date.today()
-        prepend = r'csse_covid_19_time_series/time_series_covid19_'
-        current_data = False
+        today = pd.Timestamp(date.today())
+        session = web_session()
+        raw = {}
+        probes = {}
+        interval = POLL_MIN
         start_time = time.time()
-        # Continuously re-download files until all have been updated
-        while not current_data:
+        # Probe the file headers until all have been updated, downloading
+        # each file in full only once its newest date column is today
+        while len(raw) < len(TIME_SERIES):
             try:
-                confirmed_us = save_from_web(r'{}confirmed_US.csv'.format(prepend))
-                print('confirmed_us      ', confirmed_us.columns[-1])
-                confirmed_global = save_from_web(r'{}confirmed_global.csv'.format(prepend))
-                print('confirmed_global  ', confirmed_global.columns[-1])
-                deaths_us = save_from_web(r'{}deaths_US.csv'.format(prepend))
-                print('deaths_us         ', deaths_us.columns[-1])
-                deaths_global = save_from_web(r'{}deaths_global.csv'.format(prepend))
-                print('deaths_global     ', deaths_global.columns[-1])
-                recovered_global =save_from_web(r'{}recovered_global.csv'.format(prepend))
-                print('recovered_global  ', recovered_global.columns[-1])
-
-                csv_files = {'1': confirmed_us,
-                            '2': confirmed_global,
-                            '3': deaths_us,
-                            '4': deaths_global,
-                            '5': recovered_global}
-
-                responses = {'1': False,
-                            '2': False,
-                            '3': False,
-                            '4': False,
-                            '5': False}
-
-                for csv in csv_files:
-                    if pd.to_datetime(csv_files[csv].columns[-1]) == today:
-                        responses[csv] = True
-
-                if sum(responses.values()) == 5:
-                    current_data = True
-                    print()
-                    print(time.strftime('%H:%M:%S', time.localtime(time.time())))
-                    print('Date = {}'.format(confirmed_us.columns[-1]))
-                elif update == 'manual':
-                    current_data = True
-                    print()
-                    print(time.strftime('%H:%M:%S', time.localtime(time.time())))
-                    print('Date = {}'.format(confirmed_us.columns[-1]))
-                else:
+                if update == 'manual':
+                    raw = fetch_time_series(session, base_url)
+                    for name in TIME_SERIES:
+                        print('{:<18}'.format(name), raw[name].columns[-1])
+                    break
+
+                pending = [name for name in TIME_SERIES if name not in raw]
+                current = []
+                for name in pending:
+                    latest = probe_time_series(name, session, probes, base_url)
+                    print('{:<18}'.format(name), latest.strftime('%m/%d/%Y'))
+                    if latest == today:
+                        current.append(name)
+                raw.update(fetch_time_series(session, base_url, names=current))
+
+                if len(raw) < len(TIME_SERIES):
                     if time.time() - start_time > 2.5 * 3600:  # stop checking after 2.5 hours
                         print()
                         print('Timed out after 2.5 hours')
                         print(time.strftime('%H:%M:%S', time.localtime(time.time())))
                         return 'end'
+                    # the remaining files usually follow within minutes of the
+                    # first one, so poll quickly after progress and back off otherwise
+                    interval = POLL_MIN if current else min(2 * interval, POLL_MAX)
                     print()
                     print('Waiting for GitHub update...')
-                    time.sleep(600)
+                    time.sleep(interval)
                     print()
                     print(time.strftime('%H:%M:%S', time.localtime(time.time())))
-            except requests.exceptions.ConnectionError:
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.RetryError):
                 if time.time() - start_time > 4.5 * 3600:  # stop checking after 2.5 hours
                     print()
                     print('Timed out after 4.5 hours')
@@ -82,396 +184,306 @@ def load_time_series(source='web', update='manual'):
                 time.sleep(600)
                 print()
                 print(time.strftime('%H:%M:%S', time.localtime(time.time())))
-        
-        confirmed_us.to_csv('data/raw/time_series_covid19_confirmed_US.csv', index=False)
-        confirmed_global.to_csv('data/raw/time_series_covid19_confirmed_global.csv', index=False)
-        deaths_us.to_csv('data/raw/time_series_covid19_deaths_US.csv', index=False)
-        deaths_global.to_csv('data/raw/time_series_covid19_deaths_global.csv', index=False)
-        recovered_global.to_csv('data/raw/time_series_covid19_recovered_global.csv', index=False)
+
+        print()
+        print(time.strftime('%H:%M:%S', time.localtime(time.time())))
+        print('Date = {}'.format(raw['confirmed_US'].columns[-1]))
+
+        for name in TIME_SERIES:
+            raw[name].to_csv('data/raw/time_series_covid19_{}.csv'.format(name), index=False)
 
     elif source == 'folder':
-        confirmed_us = pd.read_csv('data/raw/time_series_covid19_confirmed_US.csv')
-        confirmed_global = pd.read_csv('data/raw/time_series_covid19_confirmed_global.csv')
-        deaths_us = pd.read_csv('data/raw/time_series_covid19_deaths_US.csv')
-        deaths_global = pd.read_csv('data/raw/time_series_covid19_deaths_global.csv')
-        recovered_global = pd.read_csv('data/raw/time_series_covid19_recovered_global.csv')
+        raw = {name: pd.read_csv('data/raw/time_series_covid19_{}.csv'.format(name)) for name in TIME_SERIES}
 
-    dates = []
-    for column in confirmed_global.columns:
-        if re.search(r'([0-9]{1,2}\/[0-9]{1,2}\/([20-99]))', column):
-            dates.append(column)
+    return raw
 
-    print()
-    print('Transforming data')
-    # Melt (de-pivot), join, and union the above tables
-    confirmed_us_melt = pd.melt(
-        confirmed_us,
-        id_vars=['Country_Region', 'Province_State', 'Admin2', 'Lat', 'Long_'],
-        value_vars=dates).rename(columns={'Country_Region': 'Country/Region',
-                                        'Province_State': 'Province/State',
-                                        'Lat': 'Latitude',
-                                        'Long_': 'Longitude',
-                                        'variable': 'date',
-                                        'value': 'Confirmed'})
-
-    deaths_us_melt = pd.melt(
-        deaths_us,
-        id_vars=['Country_Region', 'Province_State', 'Admin2', 'Lat', 'Long_'],
-        value_vars=dates).rename(columns={'Country_Region': 'Country/Region',
-                                        'Province_State': 'Province/State',
-                                        'Lat': 'Latitude',
-                                        'Long_': 'Longitude',
-                                        'variable': 'date',
-                                        'value': 'Deaths'})
-
-    us_confirmed_deaths = pd.merge(
-        confirmed_us_melt,
-        deaths_us_melt[['date',
-                        'Country/Region',
-                        'Province/State',
-                        'Admin2',
-                        'Deaths']],
-        on=['date',
-            'Country/Region',
-            'Province/State',
-            'Admin2'],
-        how='outer').assign(Recovered=np.nan)[['date',
-                                               'Country/Region',
-                                               'Province/State',
-                                               'Admin2',
-                                               'Latitude',
-                                               'Longitude',
-                                               'Confirmed',
-                                               'Deaths',
-                                               'Recovered']]
-
-    confirmed_global_melt = pd.melt(
-        confirmed_global,
-        id_vars=['Country/Region', 'Province/State', 'Lat', 'Long'],
-        value_vars=dates).rename(columns={'Lat': 'Latitude',
-                                        'Long': 'Longitude',
-                                        'variable': 'date',
-                                        'value': 'Confirmed'}).assign(Admin2=np.nan)
-
-    # aggregate Canada confirmed because recovered is not aggregated
-    confirmed_canada = confirmed_global_melt[confirmed_global_melt['Country/Region'] == 'Canada'].groupby('date', as_index=False).agg({'Confirmed': 'sum'})
-    confirmed_canada['Country/Region'] = 'Canada'
-    confirmed_canada['Province/State'] = np.nan
-    confirmed_canada['Latitude'] = 56.1304
-    confirmed_canada['Longitude'] = -106.346800
-    confirmed_canada['Admin2'] = np.nan
-    confirmed_canada = confirmed_canada[['Country/Region', 'Province/State', 'Latitude', 'Longitude', 'date', 'Confirmed', 'Admin2']]
-
-    confirmed_global_melt = pd.concat([
-        confirmed_global_melt[confirmed_global_melt['Country/Region'] != 'Canada'],
-        confirmed_canada])
-
-    deaths_global_melt = pd.melt(deaths_global,
-        id_vars=['Country/Region', 'Province/State', 'Lat', 'Long'],
-        value_vars=dates).rename(columns={'Lat': 'Latitude',
-                                        'Long': 'Longitude',
-                                        'variable': 'date',
-                                        'value': 'Deaths'}).assign(Admin2=np.nan)
-
-    # aggregate Canada deaths because recovered is not aggregated
-    deaths_canada = deaths_global_melt[deaths_global_melt['Country/Region'] == 'Canada'].groupby('date', as_index=False).agg({'Deaths': 'sum'})
-    deaths_canada['Country/Region'] = 'Canada'
-    deaths_canada['Province/State'] = np.nan
-    deaths_canada['Latitude'] = 56.1304
-    deaths_canada['Longitude'] = -106.346800
-    deaths_canada['Admin2'] = np.nan
-    deaths_canada = deaths_canada[['Country/Region', 'Province/State', 'Latitude', 'Longitude', 'date', 'Deaths', 'Admin2']]
-
-    deaths_global_melt = pd.concat([
-        deaths_global_melt[deaths_global_melt['Country/Region'] != 'Canada'],
-        deaths_canada])
-
-    confirmed_deaths_global = pd.merge(
-        confirmed_global_melt,
-        deaths_global_melt[['date',
-                            'Country/Region',
-                            'Province/State',
-                            'Admin2',
-                            'Deaths']],
-        on=['date', 'Country/Region', 'Province/State', 'Admin2'],
-        how='outer')
-
-    # fix some mismatched coordinates
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Syria', ['Latitude']] = 34.802075
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Syria', ['Longitude']] = 38.996815
-    
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Mozambique', ['Latitude']] = -18.6657
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Mozambique', ['Longitude']] = 35.5296
-    
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Timor-Leste', ['Latitude']] = -8.8742
-    confirmed_deaths_global.loc[confirmed_deaths_global['Country/Region'] == 'Timor-Leste', ['Longitude']] = 125.7275
-
-    recovered_global_melt = pd.melt(
-        recovered_global,
-        id_vars=['Country/Region', 'Province/State', 'Lat', 'Long'],
-        value_vars=dates).rename(columns={'Lat': 'Latitude',
-                                        'Long': 'Longitude',
-                                        'variable': 'date',
-                                        'value': 'Recovered'}).assign(Admin2=np.nan)
-
-    # fix some mismatched coordinates
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Syria', ['Latitude']] = 34.802075
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Syria', ['Longitude']] = 38.996815
-    
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Mozambique', ['Latitude']] = -18.6657
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Mozambique', ['Longitude']] = 35.5296
-    
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Timor-Leste', ['Latitude']] = -8.8742
-    recovered_global_melt.loc[recovered_global_melt['Country/Region'] == 'Timor-Leste', ['Longitude']] = 125.7275
-
-    global_confirmed_deaths_recovered = pd.merge(
-        confirmed_deaths_global,
-        recovered_global_melt[['date',
-                               'Country/Region',
-                               'Province/State',
-                               'Admin2',
-                               'Recovered']],
-        on=['date', 'Country/Region', 'Province/State', 'Admin2'],
-        how='outer')[['date',
-                    'Country/Region',
-                    'Province/State',
-                    'Admin2',
-                    'Latitude',
-                    'Longitude',
-                    'Confirmed',
-                    'Deaths',
-                    'Recovered']]
-
-    df = pd.concat([
-        us_confirmed_deaths,
-        global_confirmed_deaths_recovered
-    ])
-
-    df['date'] = pd.to_datetime(df['date'])
+def date_columns(df):
+    return [column for column in df.columns if re.search(r'([0-9]{1,2}\/[0-9]{1,2}\/([20-99]))', column)]
+
+def parse_dates(columns):
+    return pd.to_datetime(pd.Index(columns), format='%m/%d/%y')
+
+def wide_table(df, dates):
+    '''
+    splits a raw wide table into its region columns and a regions x dates array
+    of its counts
+    '''
+    df = df.rename(columns={'Country_Region': 'Country/Region',
+                            'Province_State': 'Province/State',
+                            'Lat': 'Latitude',
+                            'Long_': 'Longitude',
+                            'Long': 'Longitude'})
+    return df.reindex(columns=REGION_KEYS + ['Latitude', 'Longitude']), df[dates].to_numpy(dtype='float64')
+
+def collapse_country(regions, values, country, latitude, longitude):
+    '''
+    sums the rows of one country into a single national row
+    '''
+    rows = (regions['Country/Region'] == country).values
+    if not rows.any():
+        return regions, values
+    national = pd.DataFrame({'Country/Region': [country],
+                             'Latitude': [latitude],
+                             'Longitude': [longitude]}).reindex(columns=regions.columns)
+    return (pd.concat([regions[~rows], national], ignore_index=True),
+            np.vstack([values[~rows], np.nansum(values[rows], axis=0, keepdims=True)]))
+
+def national_only(regions, national):
+    '''
+    returns (country, latitude, longitude) for the countries which regions
+    breaks down by province but national only reports as one national row
+    '''
+    by_province = set(regions.loc[regions['Province/State'].notna(), 'Country/Region'])
+    split = set(national.loc[national['Province/State'].notna(), 'Country/Region'])
+    rows = national[national['Province/State'].isna() & national['Country/Region'].isin(by_province - split)]
+    return list(rows[['Country/Region', 'Latitude', 'Longitude']].itertuples(index=False, name=None))
+
+def region_names(regions):
+    # object columns, since the tables may hold the names as str or object dtype
+    return (regions['Country/Region'].fillna('').astype(object) + '|'
+            + regions['Province/State'].fillna('').astype(object) + '|'
+            + regions['Admin2'].fillna('').astype(str).astype(object))
+
+def align_tables(tables):
+    '''
+    aligns (regions, values) pairs from wide_table on integer region ids.
+    Returns the union of the regions, with coordinates taken from the first
+    table only, and one regions x dates array per table which is NaN where the
+    table has no row for a region
+    '''
+    lengths = [len(values) for regions, values in tables]
+    ids, names = pd.factorize(pd.concat([region_names(regions) for regions, values in tables], ignore_index=True))
+    first = np.unique(ids, return_index=True)[1]  # ids are numbered in order of first appearance
+    regions = pd.concat([regions for regions, values in tables], ignore_index=True).iloc[first].reset_index(drop=True)
+    regions.loc[first >= lengths[0], ['Latitude', 'Longitude']] = np.nan
+
+    arrays = []
+    for (table_regions, values), table_ids in zip(tables, np.split(ids, np.cumsum(lengths)[:-1])):
+        array = np.full((len(names), values.shape[1]), np.nan)
+        array[table_ids] = values
+        arrays.append(array)
+    return regions, arrays
+
+def transform_time_series(raw, since=None):
+    '''
+    joins the raw time series files into one long DataFrame. The wide tables
+    are aligned on integer region ids and combined as regions x dates arrays,
+    and only unpivoted to the long layout at the end. since is the last date
+    already processed; when given, only the dates after it are transformed,
+    along with the week before them which the share_of_last_week calculation
+    looks back on.
+    '''
+    confirmed_us = raw['confirmed_US']
+    confirmed_global = raw['confirmed_global']
+    deaths_us = raw['deaths_US']
+    deaths_global = raw['deaths_global']
+    recovered_global = raw['recovered_global']
+
+    dates = date_columns(confirmed_global)
+
+    if since is not None:
+        if pd.to_datetime(dates[-1]) <= since:
+            print()
+            print('No new dates since {}'.format(since.strftime('%m/%d/%Y')))
+            return 'current'
+        dates = [column for column, day in zip(dates, parse_dates(dates)) if day > since - pd.Timedelta(days=7)]
+
+    # Align each family of tables on integer region ids as regions x dates arrays
+    us_regions, (us_confirmed, us_deaths) = align_tables([
+        wide_table(confirmed_us, dates),
+        wide_table(deaths_us, dates)])
+
+    # aggregate the confirmed and deaths of countries whose recoveries are only
+    # reported nationally (Canada) to the same national row
+    tables = [wide_table(table, dates) for table in [confirmed_global, deaths_global, recovered_global]]
+    for country, latitude, longitude in national_only(tables[0][0], tables[2][0]):
+        tables[:2] = [collapse_country(*table, country, latitude, longitude) for table in tables[:2]]
+    global_regions, (global_confirmed, global_deaths, global_recovered) = align_tables(tables)
+
+    regions = pd.concat([us_regions, global_regions], ignore_index=True)
+    confirmed = np.vstack([us_confirmed, global_confirmed])
+    deaths = np.vstack([us_deaths, global_deaths])
+    recovered = np.vstack([np.full_like(us_confirmed, np.nan), global_recovered])
 
     # Create "Recovered" state for unassigned recoveries
-    df.loc[(df['Country/Region'] == 'US') & (df['Recovered'].notna()), 'Province/State'] = 'Recovered'
-    df.loc[df['Province/State'] == 'Recovered', 'Confirmed'] = 0
-    df.loc[df['Province/State'] == 'Recovered', 'Deaths'] = 0
-    df['Recovered'] = df['Recovered'].fillna(0)
+    unassigned = (regions['Country/Region'] == 'US').values & ~np.isnan(recovered).all(axis=1)
+    regions.loc[unassigned, 'Province/State'] = 'Recovered'
+    confirmed[unassigned] = 0
+    deaths[unassigned] = 0
+    recovered = np.nan_to_num(recovered)
 
     # Create "Active" column
-    df['Active'] = df['Confirmed'] - df['Deaths'] - df['Recovered']
-    df.loc[df['Province/State'] == 'Recovered', 'Active'] = 0
+    active = confirmed - deaths - recovered
+    active[unassigned] = 0
+
+    # Only now unpivot to the long layout, date-major and in region order
+    order = regions.sort_values(by=REGION_KEYS).index.values
+    regions = regions.iloc[order]
+    df = pd.DataFrame({'date': np.repeat(parse_dates(dates).values, len(order))})
+    for column in REGION_KEYS + ['Latitude', 'Longitude']:
+        df[column] = np.tile(regions[column].values, len(dates))
+    for column, values in [('Confirmed', confirmed), ('Deaths', deaths), ('Recovered', recovered), ('Active', active)]:
+        values = values[order].T.ravel()
+        df[column] = values.astype(int) if column in ['Recovered', 'Active'] or not np.isnan(values).any() else values
 
-    df['Recovered'] = df['Recovered'].astype(int)
-    df['Active'] = df['Active'].astype(int)
+    # Rename countries
+    df = normalize_names(df, load_aliases('time_series'))
 
-    df = df.sort_values(by=['date', 'Country/Region', 'Province/State', 'Admin2']).reset_index(drop=True)
+    return df
 
-    # Rename countries
-    df['Country/Region'].replace('Korea, South', 'South Korea', inplace=True)
-    df['Country/Region'].replace('Taiwan*', 'Taiwan', inplace=True)
+def date_chunks(raw, since=None, days=7):
+    '''
+    splits the raw time series files into chunks of CHUNK_MONTHS months of
+    their date columns and yields (raw files of the chunk, first date of the
+    chunk). Each chunk also carries the week before it, which the
+    share_of_last_week calculation looks back on. With since, only the dates
+    after it are split.
+    '''
+    dates = date_columns(raw['confirmed_global'])
+    parsed = parse_dates(dates)
+    known = set(dates)
+    regions = {name: [column for column in df.columns if column not in known] for name, df in raw.items()}
+    new = np.flatnonzero(parsed > since) if since is not None else np.arange(len(dates))
+    months = parsed[new].strftime('%Y-%m')
+    unique = pd.unique(months)
+    for first in range(0, len(unique), CHUNK_MONTHS):
+        index = new[np.isin(months, unique[first:first + CHUNK_MONTHS])]
+        columns = dates[max(index[0] - days, 0):index[-1] + 1]
+        yield {name: df[regions[name] + columns] for name, df in raw.items()}, parsed[index[0]]
+
+def load_aliases(layout):
+    '''
+    returns the name aliases from data/aliases.csv which apply to the layout
+    as {column: {alias: name}}
+    '''
+    aliases = pd.read_csv('data/aliases.csv')
+    aliases = aliases[aliases['scope'].isin(['all', layout])]
+    return {column: dict(zip(group['alias'], group['name'])) for column, group in aliases.groupby('column')}
 
+def normalize_names(df, aliases):
+    '''
+    replaces aliases with their canonical names in a single pass per column.
+    Each distinct name is resolved once and then broadcast back to the rows
+    through its factorized code, so the cost doesn't grow with the alias count.
+    '''
+    for column, mapping in aliases.items():
+        if column in df:
+            codes, names = pd.factorize(df[column])
+            names = np.append(pd.Series(names, dtype=object).map(lambda name: mapping.get(name, name)).values, np.nan)
+            df[column] = names[codes]  # code -1 (missing) picks the trailing NaN
     return df
 
-def load_daily_reports(source='web'):
-    if source=='web':
-        # Load files from web
-        file_date = date(2020, 1, 22)
-        dates = []
+def load_time_series(source='web', update='manual', base_url=TIME_SERIES_URL, since=None):
+    raw = download_time_series(source, update, base_url)
+    if isinstance(raw, str):
+        return raw
+    return transform_time_series(raw, since)
 
-        while file_date <= date.today():
-            dates.append(file_date)
+def download_daily_report(file, session, base_url=DAILY_REPORTS_URL, timeout=TIMEOUT):
+    '''
+    saves one daily report to data/raw and returns whether it was published
+    '''
+    response = session.get(r'{}{}.csv'.format(base_url, file), timeout=timeout)
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    with open('data/raw/{}.csv'.format(file), 'wb') as f:
+        f.write(response.content)
+    print(file)
+    return True
+
+def sync_daily_reports(session=None, base_url=DAILY_REPORTS_URL, timeout=TIMEOUT):
+    '''
+    downloads the daily reports which are missing from data/raw. Gaps in the
+    archive are fetched several at a time; after the newest report on disk,
+    dates are requested one by one until the first that isn't published yet.
+    Reports already on disk are never requested again, so a warm sync usually
+    costs a single request.
+    '''
+    session = session or web_session(pool_size=DAILY_WORKERS)
+    file_date = date(2020, 1, 22)
+    dates = []
+    while file_date <= date.today():
+        dates.append(file_date)
+        file_date += timedelta(days=1)
+    on_disk = [file_date for file_date in dates
+               if os.path.exists('data/raw/{}.csv'.format(file_date.strftime('%m-%d-%Y')))]
+
+    if on_disk:
+        missing = [file_date for file_date in dates if file_date < on_disk[-1] and file_date not in on_disk]
+    else:
+        missing = dates
+    with ThreadPoolExecutor(max_workers=DAILY_WORKERS) as executor:
+        futures = [executor.submit(download_daily_report, file_date.strftime('%m-%d-%Y'), session, base_url, timeout)
+                   for file_date in missing]
+        for future in futures:
+            future.result()
+
+    if on_disk:
+        file_date = on_disk[-1] + timedelta(days=1)
+        while file_date <= date.today() and download_daily_report(file_date.strftime('%m-%d-%Y'), session, base_url, timeout):
             file_date += timedelta(days=1)
-            
-        files = []
-        for file in dates:
-            file = file.strftime("%m-%d-%Y")
-            url = r'csse_covid_19_daily_reports/{}.csv'.format(file)
-            raw_string = requests.get(url).content
-            df = pd.read_csv(io.StringIO(raw_string.decode('utf-8')))
-            if b'404: Not Found' not in raw_string:
-                df.to_csv('data/raw/{}.csv'.format(file), index=False)
-                print(file)
-            df['date'] = pd.to_datetime(file)
-            df.rename(columns={'Province_State': 'Province/State',
-                               'Country_Region': 'Country/Region',
-                               'Lat': 'Latitude',
-                               'Long_': 'Longitude'}, inplace=True)
-            files.append(df)
-
-    elif source=='folder':
-        # Load files from folder
-        path = 'data/raw'
-        all_files = glob.glob(path + "/*.csv")
-
-        files = []
-
-        for filename in all_files:
-            file = re.search(r'([0-9]{2}\-[0-9]{2}\-[0-9]{4})', filename)[0]
-            print(file)
-            df = pd.read_csv(filename, index_col=None, header=0)
-            df['date'] = pd.to_datetime(file)
-            df.rename(columns={'Province_State': 'Province/State',
-                               'Country_Region': 'Country/Region',
-                               'Lat': 'Latitude',
-                               'Long_': 'Longitude'}, inplace=True)
-            files.append(df)
-
-    # Rename countries with duplicate naming conventions
-    df['Country/Region'].replace('Mainland China', 'China', inplace=True)
-    df['Country/Region'].replace('Hong Kong SAR', 'Hong Kong', inplace=True)
-    df['Country/Region'].replace(' Azerbaijan', 'Azerbaijan', inplace=True)
-    df['Country/Region'].replace('Holy See', 'Vatican City', inplace=True)
-    df['Country/Region'].replace('Iran (Islamic Republic of)', 'Iran', inplace=True)
-    df['Country/Region'].replace('Taiwan*', 'Taiwan', inplace=True)
-    df['Country/Region'].replace('Korea, South', 'South Korea', inplace=True)
-    df['Country/Region'].replace('Viet Nam', 'Vietnam', inplace=True)
-    df['Country/Region'].replace('Macao SAR', 'Macau', inplace=True)
-    df['Country/Region'].replace('Russian Federation', 'Russia', inplace=True)
-    df['Country/Region'].replace('Republic of Moldova', 'Moldova', inplace=True)
-    df['Country/Region'].replace('Czechia', 'Czech Republic', inplace=True)
-    df['Country/Region'].replace('Congo (Kinshasa)', 'Congo', inplace=True)
-    df['Country/Region'].replace('Northern Ireland', 'United Kingdom', inplace=True)
-    df['Country/Region'].replace('Republic of Korea', 'South Korea', inplace=True)
-    df['Country/Region'].replace('Congo (Brazzaville)', 'Congo', inplace=True)
-    df['Country/Region'].replace('Taipei and environs', 'Taiwan', inplace=True)
-    df['Country/Region'].replace('Others', 'Cruise Ship', inplace=True)
-    df['Province/State'].replace('Cruise Ship', 'Diamond Princess cruise ship', inplace=True)
-    df['Province/State'].replace('From Diamond Princess', 'Diamond Princess cruise ship', inplace=True)
-
-    # Replace old reporting standards
-    df['Province/State'].replace('Chicago', 'Illinois', inplace=True)
-    df['Province/State'].replace('Chicago, IL', 'Illinois', inplace=True)
-    df['Province/State'].replace('Cook County, IL', 'Illinois', inplace=True)
-    df['Province/State'].replace('Boston, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace(' Norfolk County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Suffolk County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Middlesex County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Norwell County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Plymouth County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Norfolk County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Berkshire County, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Unknown Location, MA', 'Massachusetts', inplace=True)
-    df['Province/State'].replace('Los Angeles, CA', 'California', inplace=True)
-    df['Province/State'].replace('Orange, CA', 'California', inplace=True)
-    df['Province/State'].replace('Santa Clara, CA', 'California', inplace=True)
-    df['Province/State'].replace('San Benito, CA', 'California', inplace=True)
-    df['Province/State'].replace('Humboldt County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Sacramento County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Travis, CA (From Diamond Princess)', 'California', inplace=True)
-    df['Province/State'].replace('Placer County, CA', 'California', inplace=True)
-    df['Province/State'].replace('San Mateo, CA', 'California', inplace=True)
-    df['Province/State'].replace('Sonoma County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Berkeley, CA', 'California', inplace=True)
-    df['Province/State'].replace('Orange County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Contra Costa County, CA', 'California', inplace=True)
-    df['Province/State'].replace('San Francisco County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Yolo County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Santa Clara County, CA', 'California', inplace=True)
-    df['Province/State'].replace('San Diego County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Travis, CA', 'California', inplace=True)
-    df['Province/State'].replace('Alameda County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Madera County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Santa Cruz County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Fresno County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Riverside County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Shasta County, CA', 'California', inplace=True)
-    df['Province/State'].replace('Seattle, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Snohomish County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('King County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Unassigned Location, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Clark County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Jefferson County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Pierce County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Kittitas County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Grant County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Spokane County, WA', 'Washington', inplace=True)
-    df['Province/State'].replace('Tempe, AZ', 'Arizona', inplace=True)
-    df['Province/State'].replace('Maricopa County, AZ', 'Arizona', inplace=True)
-    df['Province/State'].replace('Pinal County, AZ', 'Arizona', inplace=True)
-    df['Province/State'].replace('Madison, WI', 'Wisconsin', inplace=True)
-    df['Province/State'].replace('San Antonio, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Lackland, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Lackland, TX (From Diamond Princess)', 'Texas', inplace=True)
-    df['Province/State'].replace('Harris County, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Fort Bend County, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Montgomery County, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Collin County, TX', 'Texas', inplace=True)
-    df['Province/State'].replace('Ashland, NE', 'Nebraska', inplace=True)
-    df['Province/State'].replace('Omaha, NE (From Diamond Princess)', 'Nebraska', inplace=True)
-    df['Province/State'].replace('Douglas County, NE', 'Nebraska', inplace=True)
-    df['Province/State'].replace('Portland, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Umatilla, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Klamath County, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Douglas County, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Marion County, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Jackson County, OR ', 'Oregon', inplace=True)
-    df['Province/State'].replace('Washington County, OR', 'Oregon', inplace=True)
-    df['Province/State'].replace('Providence, RI', 'Rhode Island', inplace=True)
-    df['Province/State'].replace('Providence County, RI', 'Rhode Island', inplace=True)
-    df['Province/State'].replace('Grafton County, NH', 'New Hampshire', inplace=True)
-    df['Province/State'].replace('Rockingham County, NH', 'New Hampshire', inplace=True)
-    df['Province/State'].replace('Hillsborough, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Sarasota, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Santa Rosa County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Broward County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Lee County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Volusia County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Manatee County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Okaloosa County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('Charlotte County, FL', 'Florida', inplace=True)
-    df['Province/State'].replace('New York City, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Westchester County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Queens County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('New York County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Nassau, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Nassau County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Rockland County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Saratoga County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Suffolk County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Ulster County, NY', 'New York', inplace=True)
-    df['Province/State'].replace('Fulton County, GA', 'Georgia', inplace=True)
-    df['Province/State'].replace('Floyd County, GA', 'Georgia', inplace=True)
-    df['Province/State'].replace('Polk County, GA', 'Georgia', inplace=True)
-    df['Province/State'].replace('Cherokee County, GA', 'Georgia', inplace=True)
-    df['Province/State'].replace('Cobb County, GA', 'Georgia', inplace=True)
-    df['Province/State'].replace('Wake County, NC', 'North Carolina', inplace=True)
-    df['Province/State'].replace('Chatham County, NC', 'North Carolina', inplace=True)
-    df['Province/State'].replace('Bergen County, NJ', 'New Jersey', inplace=True)
-    df['Province/State'].replace('Hudson County, NJ', 'New Jersey', inplace=True)
-    df['Province/State'].replace('Clark County, NV', 'Nevada', inplace=True)
-    df['Province/State'].replace('Washoe County, NV', 'Nevada', inplace=True)
-    df['Province/State'].replace('Williamson County, TN', 'Tennessee', inplace=True)
-    df['Province/State'].replace('Davidson County, TN', 'Tennessee', inplace=True)
-    df['Province/State'].replace('Shelby County, TN', 'Tennessee', inplace=True)
-    df['Province/State'].replace('Montgomery County, MD', 'Maryland', inplace=True)
-    df['Province/State'].replace('Harford County, MD', 'Maryland', inplace=True)
-    df['Province/State'].replace('Denver County, CO', 'Colorado', inplace=True)
-    df['Province/State'].replace('Summit County, CO', 'Colorado', inplace=True)
-    df['Province/State'].replace('Douglas County, CO', 'Colorado', inplace=True)
-    df['Province/State'].replace('El Paso County, CO', 'Colorado', inplace=True)
-    df['Province/State'].replace('Delaware County, PA', 'Pennsylvania', inplace=True)
-    df['Province/State'].replace('Wayne County, PA', 'Pennsylvania', inplace=True)
-    df['Province/State'].replace('Montgomery County, PA', 'Pennsylvania', inplace=True)
-    df['Province/State'].replace('Fayette County, KY', 'Kentucky', inplace=True)
-    df['Province/State'].replace('Jefferson County, KY', 'Kentucky', inplace=True)
-    df['Province/State'].replace('Harrison County, KY', 'Kentucky', inplace=True)
-    df['Province/State'].replace('Marion County, IN', 'Indiana', inplace=True)
-    df['Province/State'].replace('Hendricks County, IN', 'Indiana', inplace=True)
-    df['Province/State'].replace('Ramsey County, MN', 'Minnesota', inplace=True)
-    df['Province/State'].replace('Carver County, MN', 'Minnesota', inplace=True)
-    df['Province/State'].replace('Fairfield County, CT', 'Connecticut', inplace=True)
-    df['Province/State'].replace('Charleston County, SC', 'South Carolina', inplace=True)
-    df['Province/State'].replace('Spartanburg County, SC', 'South Carolina', inplace=True)
-    df['Province/State'].replace('Kershaw County, SC', 'South Carolina', inplace=True)
-    df['Province/State'].replace('Davis County, UT', 'Utah', inplace=True)
-    df['Province/State'].replace('Honolulu County, HI', 'Hawaii', inplace=True)
-    df['Province/State'].replace('Tulsa County, OK', 'Oklahoma', inplace=True)
-    df['Province/State'].replace('Fairfax County, VA', 'Virginia', inplace=True)
-    df['Province/State'].replace('St. Louis County, MO', 'Missouri', inplace=True)
-    df['Province/State'].replace('Unassigned Location, VT', 'Vermont', inplace=True)
-    df['Province/State'].replace('Bennington County, VT', 'Vermont', inplace=True)
-    df['Province/State'].replace('Johnson County, IA', 'Iowa', inplace=True)
-    df['Province/State'].replace('Jefferson Parish, LA', 'Louisiana', inplace=True)
-    df['Province/State'].replace('Johnson County, KS', 'Kansas', inplace=True)
-    df['Province/State'].replace('Washington, D.C.', 'District of Columbia', inplace=True)
+
+def read_daily_report(filename):
+    file = re.search(r'([0-9]{2}\-[0-9]{2}\-[0-9]{4})', filename)[0]
+    df = pd.read_csv(filename, index_col=None, header=0)
+    df['date'] = pd.to_datetime(file)
+    df.rename(columns={'Province_State': 'Province/State',
+                       'Country_Region': 'Country/Region',
+                       'Last_Update': 'Last Update',
+                       'Lat': 'Latitude',
+                       'Long_': 'Longitude'}, inplace=True)
+    return df
+
+def convert_daily_report(filename):
+    '''
+    rewrites one daily report CSV as a Parquet file with the harmonized schema
+    '''
+    df = read_daily_report(filename)
+    df = df.reindex(columns=list(DAILY_SCHEMA)).astype(DAILY_SCHEMA)
+    df.to_parquet(os.path.join(DAILY_STORE, '{}.parquet'.format(df['date'].iloc[0].strftime('%Y-%m-%d'))), index=False)
+
+def convert_daily_reports():
+    '''
+    converts the daily report CSVs in data/raw which are not in the columnar
+    store yet, or which changed since they were converted
+    '''
+    os.makedirs(DAILY_STORE, exist_ok=True)
+    pending = []
+    for filename in glob.glob('data/raw/[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9].csv'):
+        parquet = os.path.join(DAILY_STORE, '{}.parquet'.format(
+            datetime.strptime(os.path.basename(filename)[:10], '%m-%d-%Y').strftime('%Y-%m-%d')))
+        if not os.path.exists(parquet) or os.path.getmtime(parquet) < os.path.getmtime(filename):
+            pending.append(filename)
+
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(convert_daily_report, pending, chunksize=16))
+
+def read_daily_store(start=None, end=None, columns=None):
+    '''
+    loads the daily reports between start and end (inclusive) from the
+    columnar store, reading only the requested columns
+    '''
+    files = []
+    for filename in sorted(glob.glob(os.path.join(DAILY_STORE, '*.parquet'))):
+        file_date = pd.to_datetime(os.path.basename(filename)[:10])
+        if (start is None or file_date >= pd.to_datetime(start)) and (end is None or file_date <= pd.to_datetime(end)):
+            files.append(pd.read_parquet(filename, columns=columns))
+    return pd.concat(files, axis=0, ignore_index=True)
+
+def load_daily_reports(source='web', start=None, end=None):
+    if source == 'web':
+        # Download any missing files, then load everything from the folder
+        sync_daily_reports()
+
+    # Only files which are new or changed are parsed; everything else is
+    # scanned from the columnar store
+    convert_daily_reports()
+    df = read_daily_store(start, end)
+
+    # Rename countries with duplicate naming conventions and replace old
+    # reporting standards, see data/aliases.csv
+    df = normalize_names(df, load_aliases('daily_reports'))
 
     # Fill missing values as 0
     df['Confirmed'] = df['Confirmed'].fillna(0).astype(int)
@@ -482,11 +494,14 @@ def load_daily_reports(source='web'):
     df['Latitude'] = df['Latitude'].fillna(df.groupby('Province/State')['Latitude'].transform('mean'))
     df['Longitude'] = df['Longitude'].fillna(df.groupby('Province/State')['Longitude'].transform('mean'))
 
-    return pd.concat(files, axis=0, ignore_index=True, sort=False)
+    return df
 
-def etl(layout='time_series', source='web', update='manual'):
+def etl(layout='time_series', source='web', update='manual', since=None, raw=None):
     if layout == 'time_series':
-        df = load_time_series(source=source, update=update)
+        if raw is None:
+            df = load_time_series(source=source, update=update, since=since)
+        else:
+            df = transform_time_series(raw, since=since)
         if isinstance(df, str):
             return df
     elif layout == 'daily_reports':
@@ -509,159 +524,187 @@ def etl(layout='time_series', source='web', update='manual'):
 
     return df
 
-def worldwide(data):
-    print('processing worldwide')
-    df = data.groupby(['date', 'Country/Region'], as_index=False).agg({'Latitude': 'mean',
-                                                                       'Longitude': 'mean',
-                                                                       'Confirmed': 'sum',
-                                                                       'Deaths': 'sum',
-                                                                       'Recovered': 'sum',
-                                                                       'Active': 'sum'})
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
-
-    # Manually change some country centroids which are mislocated due to far off colonies
-    df.loc[df['Country/Region'] == 'US', 'Latitude'] = 39.810489
-    df.loc[df['Country/Region'] == 'US', 'Longitude'] = -98.555759
-
-    df.loc[df['Country/Region'] == 'France', 'Latitude'] = 46.2276
-    df.loc[df['Country/Region'] == 'France', 'Longitude'] = 2.2137
-
-    df.loc[df['Country/Region'] == 'United Kingdom', 'Latitude'] = 55.3781
-    df.loc[df['Country/Region'] == 'United Kingdom', 'Longitude'] = -3.4360
-
-    df.loc[df['Country/Region'] == 'Denmark', 'Latitude'] = 56.2639
-    df.loc[df['Country/Region'] == 'Denmark', 'Longitude'] = 9.5018
+def weekly_share(df, key='Country/Region', days=7):
+    '''
+    adds share_of_last_week, the percentage of each region's confirmed cases
+    reported in the last week. Rows are stably reordered into one contiguous
+    block per region, so the week-ago value is a plain array shift rather than
+    a groupby.
+    '''
+    codes = pd.factorize(df[key])[0]
+    order = np.argsort(codes, kind='mergesort')
+    codes = codes[order]
+    confirmed = df['Confirmed'].to_numpy()[order]
+
+    previous = np.zeros_like(confirmed)
+    same_region = codes[days:] == codes[:-days]
+    previous[days:][same_region] = confirmed[:-days][same_region]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = 100 * (confirmed - previous) / confirmed
+    share[~np.isfinite(share) | (share < 0) | (codes == -1)] = 0  # regions without a name have no history
+
+    share = share[np.argsort(order)]
+    return df.assign(share_of_last_week=share)
+
+def rollup(data, levels=hierarchy.LEVELS):
+    '''
+    aggregates the base data to every level of the hierarchy in one pass.
+    The regions of all levels are numbered in a single key space of
+    (level, date, region) cells, ordered by date and then by the level's
+    keys, so each metric is summed, and the coordinates averaged, by one
+    bincount over the rows of all levels together. Returns the cells which
+    have rows as a long DataFrame with a level column; the keys below a
+    cell's level are missing.
+    '''
+    date_codes, dates = pd.factorize(data['date'], sort=True)
+    rows, cells, frames = [], [], []
+    size = 0
+    for level, keys in levels.items():
+        members = np.flatnonzero(data[keys].notna().all(axis=1).to_numpy())
+        codes = data.iloc[members].groupby(keys, sort=True).ngroup().to_numpy()
+        groups = data.iloc[members[np.unique(codes, return_index=True)[1]]]
+        rows.append(members)
+        cells.append(size + date_codes[members] * len(groups) + codes)
+        frame = {'level': np.full(len(dates) * len(groups), level, dtype=object),
+                 'date': np.repeat(dates.values, len(groups))}
+        frame.update({key: np.tile(groups[key].to_numpy(), len(dates)) for key in keys})
+        frames.append(pd.DataFrame(frame))
+        size += len(dates) * len(groups)
+    rows = np.concatenate(rows)
+    cells = np.concatenate(cells)
+
+    df = pd.concat(frames, ignore_index=True, sort=False).reindex(columns=['level', 'date'] + REGION_KEYS)
+    for column in ['Latitude', 'Longitude']:
+        values = data[column].to_numpy(dtype='float64')[rows]
+        known = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df[column] = (np.bincount(cells, weights=np.where(known, values, 0), minlength=size)
+                          / np.bincount(cells, weights=known, minlength=size))
+    for column in schema.COUNTS:
+        values = data[column].to_numpy()
+        sums = np.bincount(cells, weights=np.nan_to_num(values[rows].astype('float64')), minlength=size)
+        df[column] = sums.astype(values.dtype) if np.issubdtype(values.dtype, np.integer) else sums
+    return df[np.bincount(cells, minlength=size) > 0].reset_index(drop=True)
+
+def level_slice(cube, name):
+    '''
+    slices the regions of one view out of the rolled up data, named after
+    their own key on the view's level (counties as "<county> County, <state>")
+    and with the view's coordinates corrected
+    '''
+    level, countries, parent = hierarchy.VIEWS[name]
+    df = cube[cube['level'] == level]
+    if countries is not None:
+        df = df[df['Country/Region'].isin(countries)]
+    if level == 'county':
+        names = df['Admin2'] + ' County, ' + df['Province/State']
+    else:
+        names = df[hierarchy.LEVELS[level][-1]]
+    df = df.assign(**{'Country/Region': names})
 
-    df.loc[df['Country/Region'] == 'Netherlands', 'Latitude'] = 52.1326
-    df.loc[df['Country/Region'] == 'Netherlands', 'Longitude'] = 5.2913
+    if name == 'us':
+        # the states are placed at their centroids rather than the mean of their counties
+        return join_regions(df.drop(columns=['Latitude', 'Longitude']), pd.read_csv('data/geo_us.csv').set_index('Province/State'))
+    overrides = join_regions(df[['Country/Region']], read_overrides(level)[['Latitude', 'Longitude']])
+    return df.assign(Latitude=overrides['Latitude'].fillna(df['Latitude']),
+                     Longitude=overrides['Longitude'].fillna(df['Longitude']))
 
-    df.loc[df['Country/Region'] == 'Canada', 'Latitude'] = 56.1304
-    df.loc[df['Country/Region'] == 'Canada', 'Longitude'] = -106.346800
+def view(cube, name):
+    '''
+    builds one output, except for its population, from the rolled up data
+    '''
+    df = weekly_share(level_slice(cube, name))
+    if hierarchy.VIEWS[name][0] == 'county':
+        df = df[df['Confirmed'] != 0]
+    return df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week']]
 
-    return df
+def read_overrides(level):
+    '''
+    returns the rows of data/overrides.csv for the regions of one level,
+    indexed by region name: the name of the region in its population table
+    (source) where it differs, a population which takes the place of the
+    table's, and coordinates which take the place of the mean of its rows
+    '''
+    overrides = pd.read_csv(OVERRIDES_FILE)
+    return overrides[overrides['level'] == level].set_index('region')
 
-def us(data):
-    print('processing US')
-    df = data[data['Country/Region'] == 'US']
-    df = df.groupby(['date', 'Province/State'], as_index=False).agg({'Confirmed': 'sum',
-                                                                     'Deaths': 'sum',
-                                                                     'Recovered': 'sum',
-                                                                     'Active': 'sum'})
-    df = df.merge(pd.read_csv('data/geo_us.csv'), left_on='Province/State', right_on='Province/State', how='left')
-    df = df.rename(columns={'Province/State': 'Country/Region'})
-    df = df[['date',
-            'Country/Region',
-            'Latitude',
-            'Longitude',
-            'Confirmed',
-            'Active',
-            'Deaths',
-            'Recovered']].sort_values(['date', 'Country/Region'])
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
-    return df
+def join_regions(df, table):
+    '''
+    adds the columns of a table of region attributes, indexed by region name,
+    to the rows of an output. The table is looked up once per distinct region
+    and the result is broadcast to the rows through the factorized names, so
+    the cost doesn't grow with the number of dates or of table rows.
+    '''
+    codes, names = pd.factorize(df['Country/Region'])
+    table = table[~table.index.duplicated()].reindex(names)
+    return df.assign(**{column: np.append(table[column].to_numpy(dtype='float64'), np.nan)[codes]  # code -1 (missing) picks the trailing NaN
+                        for column in table.columns})
 
-def eu(data):
-    print('processing Europe')
-    eu = ['Albania', 'Andorra', 'Austria', 'Belarus', 'Belgium',
-      'Bosnia and Herzegovina', 'Bulgaria', 'Croatia', 'Cyprus',
-      'Czech Republic', 'Denmark', 'Estonia', 'Finland', 'France',
-      'Germany', 'Greece', 'Hungary', 'Iceland', 'Ireland', 'Italy',
-      'Kosovo', 'Latvia', 'Liechtenstein', 'Lithuania', 'Luxembourg',
-      'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands',
-      'North Macedonia', 'Norway', 'Poland', 'Portugal', 'Romania',
-      'San Marino', 'Serbia', 'Slovakia', 'Slovenia', 'Spain', 'Sweden',
-      'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
-      'Vatican City']
-    df = data[data['Country/Region'].isin(eu)]
-    df = df.groupby(['date', 'Country/Region'], as_index=False).agg({'Latitude': 'mean',
-                                                                     'Longitude': 'mean',
-                                                                     'Confirmed': 'sum',
-                                                                     'Deaths': 'sum',
-                                                                     'Recovered': 'sum',
-                                                                     'Active': 'sum'})
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
-
-    # Manually change some country centroids which are mislocated due to far off colonies
-    df.loc[df['Country/Region'] == 'US', 'Latitude'] = 39.810489
-    df.loc[df['Country/Region'] == 'US', 'Longitude'] = -98.555759
-
-    df.loc[df['Country/Region'] == 'France', 'Latitude'] = 46.2276
-    df.loc[df['Country/Region'] == 'France', 'Longitude'] = 2.2137
-
-    df.loc[df['Country/Region'] == 'United Kingdom', 'Latitude'] = 55.3781
-    df.loc[df['Country/Region'] == 'United Kingdom', 'Longitude'] = -3.4360
-
-    df.loc[df['Country/Region'] == 'Denmark', 'Latitude'] = 56.2639
-    df.loc[df['Country/Region'] == 'Denmark', 'Longitude'] = 9.5018
-
-    df.loc[df['Country/Region'] == 'Netherlands', 'Latitude'] = 52.1326
-    df.loc[df['Country/Region'] == 'Netherlands', 'Longitude'] = 5.2913
-
-    df.loc[df['Country/Region'] == 'Canada', 'Latitude'] = 59.050000
-    df.loc[df['Country/Region'] == 'Canada', 'Longitude'] = -112.833333
-    
-    return df
+def read_groups():
+    '''
+    returns the custom region groups: one row per member with the name of the
+    group, the view (output) the member is a region of, and the member's name.
+    Like the aliases, a changed file only reaches back in history on a full run.
+    The counties can't be grouped, since they are never all in memory at once.
+    '''
+    return pd.read_csv(GROUPS_FILE).drop_duplicates()
 
-def china(data):
-    print('processing China')
-    df = data[data['Country/Region'] == 'China']
-    df = df.drop(['Country/Region', 'Admin2'], axis=1)
-    df = df.rename(columns={'Province/State': 'Country/Region'})
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
-    return df
+def region_groups(cube, groups, pops):
+    '''
+    builds the output of the custom region groups from the regions of the
+    views they are drawn from
+    '''
+    return sum_groups(pd.concat([add_population(level_slice(cube, name), name, pops).assign(view=name)
+                                 for name in groups['view'].unique()], ignore_index=True, sort=False), groups)
 
-def us_county(data):
-    print('processing US counties')
-    df = data[data['Country/Region'] == 'US']
-    df = df.assign(key=df['Admin2'] + ' County, ' + df['Province/State'])
-    df = df.drop('Country/Region', axis=1)
-    df = df.rename(columns={'key': 'Country/Region'})
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
-    df = df[df['Confirmed'] != 0]
+def sum_groups(df, groups):
+    '''
+    sums the series of the regions in df, tagged with their view, into those
+    of the groups. The regions are stacked into one regions x (metrics x dates)
+    array and the groups into a sparse groups x regions membership matrix, so
+    the series of all groups come out of a single matrix product, however
+    many groups there are. A group's population is the sum of its members'.
+    '''
+    df = df.reindex(columns=df.columns.union(['population'], sort=False)).dropna(subset=['Country/Region'])
+    region_codes, members = pd.factorize(df['view'] + '|' + df['Country/Region'].astype(object))
+    date_codes, dates = pd.factorize(df['date'], sort=True)
+
+    values = np.zeros((len(members), len(schema.COUNTS) * len(dates)))
+    for i, column in enumerate(schema.COUNTS):
+        values[region_codes, i * len(dates) + date_codes] = df[column].to_numpy(dtype='float64')
+    population = np.full(len(members), np.nan)
+    population[region_codes] = df['population'].to_numpy(dtype='float64')
+
+    columns = members.get_indexer(groups['view'] + '|' + groups['region'])
+    if (columns == -1).any():
+        print('unknown group members: {}'.format(', '.join(groups.loc[columns == -1, 'region'])))
+    group_codes, names = pd.factorize(groups['group'], sort=True)
+    known = columns != -1
+    membership = sparse.csr_matrix((np.ones(known.sum()), (group_codes[known], columns[known])),
+                                   shape=(len(names), len(members)))
+    totals = membership @ values
+
+    df = pd.DataFrame({'date': np.repeat(dates.values, len(names)),
+                       'Country/Region': np.tile(names.values, len(dates))})
+    for i, column in enumerate(schema.COUNTS):
+        series = totals[:, i * len(dates):(i + 1) * len(dates)].T.ravel()
+        df[column] = series if np.isnan(series).any() else series.astype(int)
+    df = weekly_share(df)
+    df['population'] = np.tile(membership @ population, len(dates))
     return df
 
-def us_county_compressed(data, df_us):
+def us_county_compressed(raw, df_us):
     '''
-    Same as function us_county(data) except that this compresses the data by
+    Same as publish_counties except that this compresses the data by
     including only county-level data for the most recent date and then for all
     other dates state-level data is used. Fixes the issue where the US map
     causes Heroku to time-out while loading the web page.
     '''
-    print('processing US counties')
-    df = data[data['Country/Region'] == 'US']
-
-    # Only keep county-level data for previous 8 days for share_of_last_week
-    most_recent = df['date'].max()
-    df = df[df['date'] > most_recent - pd.Timedelta(days=8)]
-
-    df = df.assign(key=df['Admin2'] + ' County, ' + df['Province/State'])
-    df = df.drop('Country/Region', axis=1)
-    df = df.rename(columns={'key': 'Country/Region'})
-    df['share_of_last_week'] = 100 * (df['Confirmed'] - df.groupby('Country/Region')['Confirmed'].shift(7, fill_value=0)) / df['Confirmed']
-    df['share_of_last_week'] = df['share_of_last_week'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df.loc[df['share_of_last_week'] < 0, 'share_of_last_week'] = 0
-    df['percentage'] = df['share_of_last_week'].apply(lambda x: '{:.1f}'.format(x))
-    
+    # Only transform county-level data for previous 8 days for share_of_last_week
+    most_recent = parse_dates(date_columns(raw['confirmed_US']))[-1]
+    data = etl('time_series', raw=raw, since=most_recent - pd.Timedelta(days=1))
+    df = view(rollup(data, {'county': hierarchy.LEVELS['county']}), 'us_county')
+
     # Only keep county-level data for most recent date
     # then merge with state-level data for previous dates
     df = df[df['date'] == most_recent]
@@ -669,17 +712,36 @@ def us_county_compressed(data, df_us):
     df_us = df_us[df_us['date'] < most_recent]
     df = pd.concat([df, df_us]).sort_values('date')
 
-    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week', 'percentage']]
+    df = df[['date', 'Country/Region', 'Latitude', 'Longitude', 'Confirmed', 'Deaths', 'Recovered', 'Active', 'share_of_last_week']]
     df = df[df['Confirmed'] != 0]
     return df
 
-def global_population():
+def read_wpp(path=WPP_FILE):
+    '''
+    streams the UN WPP file in chunks of only the columns needed and keeps
+    the medium variant's 2020 population of each location
+    '''
+    print()
+    print('extracting population')
+    chunks = pd.read_csv(path, usecols=['Location', 'Variant', 'Time', 'PopTotal'], chunksize=WPP_CHUNK)
+    return pd.concat([chunk.loc[(chunk['Variant'] == 'Medium') & (chunk['Time'] == 2020), ['Location', 'PopTotal']]
+                      for chunk in chunks], ignore_index=True)
+
+def wpp_extract(path=WPP_FILE):
+    '''
+    returns the extract of the UN WPP file, which is cached until the file's
+    size or modification time changes rather than until its contents are
+    hashed, so an unchanged file is never read at all
+    '''
+    stat = os.stat(path)
+    return memoize('wpp', content_hash(path, stat.st_size, stat.st_mtime_ns), read_wpp, path)
+
+def global_population(extract):
     # source: United Nations, https://population.un.org/wpp/Download/Standard/CSV/
     # 2019 data
     print()
     print('loading population')
-    pop_global = pd.read_csv('data/WPP2019_TotalPopulationBySex.csv')
-    pop_global = pop_global[(pop_global['Variant'] == 'Medium') & (pop_global['Time'] == 2020)][['Location', 'PopTotal']].reset_index(drop=True)
+    pop_global = extract.copy()
     pop_global['population'] = (pop_global['PopTotal'] * 1000).astype(int)
     pop_global['region'] = pop_global['Location']
     pop_global = pop_global[['region', 'population']]
@@ -708,87 +770,663 @@ def china_population(pop_global):
     pop_china.loc[32] = ['Macau', pop_global[pop_global['region'] == 'China, Macao SAR'].squeeze()['population']]
     return pop_china
 
-def population_to_worldwide(df, pop_global):
-    df = pd.merge(df, pop_global, left_on='Country/Region', right_on='region', how='left').drop(columns='region')
-
-    # correct mismatched country names
-    df.loc[df['Country/Region'] == 'Bolivia', ['population']] = pop_global.loc[pop_global['region'] == 'Bolivia (Plurinational State of)'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Brunei', ['population']] = pop_global.loc[pop_global['region'] == 'Brunei Darussalam'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Burma', ['population']] = pop_global.loc[pop_global['region'] == 'Myanmar'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Congo (Brazzaville)', ['population']] = pop_global.loc[pop_global['region'] == 'Congo'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Congo (Kinshasa)', ['population']] = pop_global.loc[pop_global['region'] == 'Democratic Republic of the Congo'].squeeze()['population']
-    df.loc[df['Country/Region'] == "Cote d'Ivoire", ['population']] = pop_global.loc[pop_global['region'] == "Côte d'Ivoire"].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Iran', ['population']] = pop_global.loc[pop_global['region'] == 'Iran (Islamic Republic of)'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Kosovo', ['population']] = 1845000  # source: https://data.worldbank.org/country/kosovo
-    df.loc[df['Country/Region'] == 'South Korea', ['population']] = pop_global.loc[pop_global['region'] == 'Republic of Korea'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Laos', ['population']] = pop_global.loc[pop_global['region'] == "Lao People's Democratic Republic"].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Moldova', ['population']] = pop_global.loc[pop_global['region'] == 'Republic of Moldova'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Russia', ['population']] = pop_global.loc[pop_global['region'] == 'Russian Federation'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Taiwan', ['population']] = pop_global.loc[pop_global['region'] == 'China, Taiwan Province of China'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Tanzania', ['population']] = pop_global.loc[pop_global['region'] == 'United Republic of Tanzania'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Venezuela', ['population']] = pop_global.loc[pop_global['region'] == 'Venezuela (Bolivarian Republic of)'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Vietnam', ['population']] = pop_global.loc[pop_global['region'] == 'Viet Nam'].squeeze()['population']
-    df.loc[df['Country/Region'] == 'Syria', ['population']] = pop_global.loc[pop_global['region'] == 'Syrian Arab Republic'].squeeze()['population']
-    df.loc[(df['Country/Region'] == 'US'), ['population']] = pop_global.loc[pop_global['region'] == 'United States of America'].squeeze()['population']
-
-    df['population'] = df['population'] / 100000
+def add_population(df, name, pops):
+    '''
+    adds the population of an output's regions in 100,000s. Each region is
+    looked up in its population table once, under its name there from
+    data/overrides.csv where that differs, unless the overrides give its
+    population outright.
+    '''
+    table = {'worldwide': 'global', 'eu': 'global', 'us': 'us', 'china': 'china'}.get(name)
+    if table is None:
+        return df  # no population data for the US counties
+    overrides = read_overrides(hierarchy.VIEWS[name][0])
+    names = pd.Index(df['Country/Region'].dropna().unique())
+    source = overrides['source'].reindex(names).fillna(pd.Series(names, index=names))
+    population = pops[table].drop_duplicates('region').set_index('region')['population'].reindex(source)
+    population = overrides['population'].reindex(names).fillna(pd.Series(population.to_numpy(dtype='float64'), index=names))
+    return join_regions(df, pd.DataFrame({'population': population / 100000}))
+
+def fingerprint(raw, through=None):
+    '''
+    hashes every row of the raw time series files over its coordinates and
+    its date columns up to and including through
+    '''
+    frames = []
+    for name in TIME_SERIES:
+        df = raw[name].rename(columns={'Country_Region': 'Country/Region',
+                                       'Province_State': 'Province/State',
+                                       'Long_': 'Long'})
+        dates = date_columns(df)
+        if through is not None:
+            dates = [column for column, day in zip(dates, parse_dates(dates)) if day <= through]
+        values = np.ascontiguousarray(df[['Lat', 'Long'] + dates].to_numpy(dtype='float64'))
+        hashes = [hashlib.sha1(row.tobytes()).hexdigest() for row in values]
+        frames.append(df.reindex(columns=REGION_KEYS).assign(table=name,
+                                                             through=parse_dates(dates[-1:])[0],
+                                                             hash=hashes))
+    return pd.concat(frames, ignore_index=True)[['table'] + REGION_KEYS + ['through', 'hash']]
+
+def detect_revisions(raw):
+    '''
+    compares the raw rows against their fingerprints from the previous run and
+    returns the rows which were revised, added or removed, along with the new
+    fingerprints to save once the outputs have been written
+    '''
+    fingerprints = fingerprint(raw)
+    try:
+        previous = pd.read_csv('data/fingerprints.csv', dtype={'hash': str}, parse_dates=['through'])
+    except FileNotFoundError:
+        return fingerprints.iloc[:0][['table'] + REGION_KEYS], fingerprints
+
+    # hash only the dates which were known last time so new columns don't count as revisions
+    current = fingerprint(raw, through=previous['through'].max())
+    compared = current.merge(previous, on=['table'] + REGION_KEYS, how='outer', suffixes=('', '_previous'))
+    revised = compared[compared['hash'] != compared['hash_previous']][['table'] + REGION_KEYS]
+    return revised.reset_index(drop=True), fingerprints
+
+def revised_regions(revised):
+    '''
+    maps revised raw rows to the names of the series they feed in each output
+    '''
+    us_table = revised['table'].str.endswith('_US')
+    country = normalize_names(revised.copy(), load_aliases('time_series'))['Country/Region']
+    state = revised['Province/State']
+    regions = {'worldwide': country,
+               'eu': country[country.isin(hierarchy.EUROPE)],
+               'china': state[~us_table & (country == 'China')],
+               'us': pd.concat([state[us_table], pd.Series('Recovered', index=state.index)[~us_table & (country == 'US')]]),
+               'us_county': (revised['Admin2'].astype(object) + ' County, ' + state.astype(object))[us_table]}
+    return {name: sorted(regions[name].dropna().unique().tolist()) for name in regions}
+
+def revised_rows(raw, revised):
+    '''
+    returns three subsets of the raw files holding the full history needed to
+    rebuild the revised series: one for the country-level outputs, with the US
+    counties pre-summed into a single national row, one for the US state
+    output and one of the US files alone for the revised counties
+    '''
+    us_table = revised['table'].str.endswith('_US')
+    countries = set(revised.loc[~us_table, 'Country/Region'])
+    if us_table.any():
+        countries.add('US')
+    states = set(revised.loc[us_table, 'Province/State'])
+    counties = set(region_names(revised.loc[us_table]))
+    recovered = (~us_table & (revised['Country/Region'] == 'US')).any()
+
+    by_country = {}
+    by_state = {}
+    by_county = {}
+    for name in TIME_SERIES:
+        df = raw[name]
+        if name.endswith('_US'):
+            by_state[name] = df[df['Province_State'].isin(states)]
+            by_county[name] = df[region_names(df.rename(columns={'Country_Region': 'Country/Region',
+                                                                 'Province_State': 'Province/State'})).isin(counties)]
+            national = df[df['Country_Region'].isin(countries)]
+            if len(national):
+                # put together in one piece, since the date sums are over a thousand columns
+                dates = date_columns(df)
+                grouped = national.groupby('Country_Region')
+                sums = grouped[dates].sum()
+                keys = pd.DataFrame({'Country_Region': sums.index, 'Province_State': np.nan, 'Admin2': np.nan})
+                national = pd.concat([keys, grouped[['Lat', 'Long_']].mean().reset_index(drop=True),
+                                      sums.reset_index(drop=True)], axis=1)
+            by_country[name] = national
+        else:
+            by_country[name] = df[df['Country/Region'].isin(countries)]
+            # the global US rows only feed the "Recovered" state
+            by_state[name] = df[(df['Country/Region'] == 'US') & recovered]
+    return by_country, by_state, by_county
+
+def replace_regions(df, name, regions, dimension):
+    '''
+    rewrites an output file with the series of the given regions replaced by
+    those in df; returns the updated regions table
+    '''
+    view = dimension[dimension['view'] == name]
+    existing = read_output(name)
+    existing = existing[~existing['region_id'].isin(view.loc[view['Country/Region'].isin(regions), 'region_id'])]
+    facts, view = split_regions(df[df['Country/Region'].isin(regions)], name, view)
+    df = pd.concat([existing, facts], ignore_index=True, sort=False)[existing.columns]
+    names = view.set_index('region_id')['Country/Region'].astype(object).reindex(df['region_id']).values
+    save_output(df.assign(name=names).sort_values(['date', 'name'], kind='mergesort').drop(columns='name'), name)
+    view = view[view['region_id'].isin(df['region_id'])]  # revised regions whose raw rows were removed
+    return pd.concat([dimension[dimension['view'] != name], view], ignore_index=True)
+
+def member_series(groups, pops, dimension):
+    '''
+    returns the series of the groups' members from the outputs of their views,
+    named, with their populations and tagged with their view as region_groups
+    takes them from the rolled up data
+    '''
+    frames = []
+    for name in groups['view'].unique():
+        view = dimension[dimension['view'] == name]
+        view = view[view['Country/Region'].isin(groups.loc[groups['view'] == name, 'region'])]
+        df = read_output(name)
+        df = df[df['region_id'].isin(view['region_id'])]
+        names = view.set_index('region_id')['Country/Region'].astype(object).reindex(df['region_id']).to_numpy()
+        frames.append(add_population(df.drop(columns='region_id').assign(**{'Country/Region': names}), name, pops).assign(view=name))
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+def replace_counties(raw, counties, dimension):
+    '''
+    rebuilds the series of the given counties from the US files a chunk of
+    dates at a time, and rewrites only the monthly partitions of the county
+    output in which their rows changed; returns the updated regions table
+    '''
+    view = dimension[dimension['view'] == 'us_county']
+    replaced = view.loc[view['Country/Region'].isin(counties), 'region_id']
+    partitions = read_manifest('us_county')
+    ids = []
+    for df, dates in county_chunks(raw):
+        facts, view = split_regions(df[df['Country/Region'].isin(counties)], 'us_county', view)
+        ids.append(facts['region_id'].unique())
+        months = facts['date'].to_numpy().astype('datetime64[M]')
+        for month in sorted(set(dates.strftime('%Y-%m')) & set(partitions)):
+            existing = read_feather(output_path('us_county', month))
+            old = existing['region_id'].isin(replaced).to_numpy()
+            rows = facts[months == np.datetime64(month)][existing.columns]
+            if schema.compact(existing[old].sort_values(['date', 'region_id'])).equals(
+                    schema.compact(rows.sort_values(['date', 'region_id']))):
+                continue
+            rows = pd.concat([existing[~old], rows], ignore_index=True, sort=False).sort_values('date', kind='mergesort')
+            partitions[month] = write_partition(rows, 'us_county', month)
+    write_manifest(partitions, 'us_county')
+    # revised counties whose raw rows were removed
+    view = view[~view['region_id'].isin(replaced) | view['region_id'].isin(np.concatenate(ids))]
+    return pd.concat([dimension[dimension['view'] != 'us_county'], view], ignore_index=True)
+
+def apply_revisions(raw, revised, pops, dimension):
+    '''
+    rebuilds and rewrites only the series whose raw rows were revised;
+    returns the updated regions table
+    '''
+    regions = revised_regions(revised)
+    by_country, by_state, by_county = revised_rows(raw, revised)
+
+    if regions['worldwide']:
+        cube = time_series_cube(by_country)
+        dimension = replace_regions(add_population(view(cube, 'worldwide'), 'worldwide', pops), 'worldwide', regions['worldwide'], dimension)
+        dimension = replace_regions(add_population(view(cube, 'eu'), 'eu', pops), 'eu', regions['eu'], dimension)
+        if regions['china']:
+            dimension = replace_regions(add_population(view(cube, 'china'), 'china', pops), 'china', regions['china'], dimension)
+
+    if regions['us']:
+        cube = time_series_cube(by_state)
+        dimension = replace_regions(add_population(view(cube, 'us'), 'us', pops), 'us', regions['us'], dimension)
+    if regions['us_county']:
+        dimension = replace_counties(by_county, regions['us_county'], dimension)
+
+    # a group also sums members which weren't revised, so the revised groups
+    # are summed again from the series of all their members in the outputs,
+    # which by now hold the rebuilt ones
+    groups = read_groups()
+    members = np.zeros(len(groups), dtype=bool)
+    for name in regions:
+        members |= ((groups['view'] == name) & groups['region'].isin(regions[name])).to_numpy()
+    groups = groups[groups['group'].isin(groups.loc[members, 'group'])]
+    if len(groups):
+        dimension = replace_regions(sum_groups(member_series(groups, pops, dimension), groups),
+                                    'groups', groups['group'].unique().tolist(), dimension)
+
+    return dimension
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def content_hash(*parts):
+    '''
+    returns a digest over the contents of DataFrames and the repr of anything else
+    '''
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, dict):
+            values = [part[key] for key in sorted(part)]
+            digest.update(content_hash(*sorted(part), *values).encode())
+        elif isinstance(part, pd.DataFrame):
+            # wide numeric blocks hash much faster as raw bytes than column by column
+            numbers = part.select_dtypes('number')
+            others = part.select_dtypes(exclude='number')
+            digest.update(repr(list(part.columns)).encode())
+            digest.update(np.ascontiguousarray(numbers.to_numpy(dtype='float64')).tobytes())
+            digest.update(pd.util.hash_pandas_object(others).values.tobytes())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+_memo = {}
+
+def memo_path(stage, key):
+    return os.path.join(CACHE_DIR, '{}-{}.pkl'.format(stage, key))
+
+def share(stage, key, value):
+    '''
+    puts a value which isn't worth caching on disk, such as the raw files, into
+    _memo alongside the memoized stages, so that workers forked afterwards find
+    it there with shared() rather than being passed a pickled copy
+    '''
+    _memo[memo_path(stage, key)] = value
 
-    return df
+def shared(stage, key):
+    return _memo[memo_path(stage, key)]
 
-def population_to_us(df, pop_us):
-    df = pd.merge(df, pop_us, left_on='Country/Region', right_on='region', how='left').drop('region', axis=1)
-    df.loc[df['Country/Region'] == 'Recovered', ['population']] = pop_us[pop_us['region'] == 'United States'].squeeze()['population']
-    df['population'] = df['population'] / 100000
-    return df
+def memoize(stage, key, func, *args, **kwargs):
+    '''
+    returns func(*args, **kwargs), reusing the result stored in CACHE_DIR if
+    the stage has already run with the same key. Keys should be content hashes
+    of everything the stage reads. Only the newest CACHE_KEEP entries of each
+    stage are kept.
+    '''
+    path = memo_path(stage, key)
+    if path in _memo:
+        return _memo[path]
+    if os.path.exists(path):
+        os.utime(path)
+        _memo[path] = pd.read_pickle(path)
+        return _memo[path]
+
+    _memo[path] = func(*args, **kwargs)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    pd.to_pickle(_memo[path], path)
+    entries = sorted(glob.glob(os.path.join(CACHE_DIR, '{}-*.pkl'.format(stage))), key=os.path.getmtime, reverse=True)
+    for stale in entries[CACHE_KEEP:]:
+        os.remove(stale)
+    return _memo[path]
+
+def populations(reference_key):
+    pop_global = memoize('pop_global', reference_key, global_population, wpp_extract())
+    pop_us = memoize('pop_us', reference_key, us_population)
+    pop_china = memoize('pop_china', reference_key, china_population, pop_global)
+    return {'global': pop_global, 'us': pop_us, 'china': pop_china}
+
+def time_series_cube(raw, since=None):
+    '''
+    transforms the raw time series files and rolls them up to every level of
+    the hierarchy but the STREAMED_LEVELS, a chunk of dates at a time, so the
+    transformed rows of the counties are only ever held for one chunk.
+    With since, only the dates after it are rolled up, along with the week
+    before them.
+    '''
+    if since is not None and parse_dates(date_columns(raw['confirmed_global']))[-1] <= since:
+        print()
+        print('No new dates since {}'.format(since.strftime('%m/%d/%Y')))
+        return 'current'
 
-def population_to_eu(df, pop_global):
-    df = pd.merge(df, pop_global, left_on='Country/Region', right_on='region', how='left').drop('region', axis=1)
-    df.loc[df['Country/Region'] == 'Kosovo', ['population']] = 1845000  # source: https://data.worldbank.org/country/kosovo
-    df.loc[df['Country/Region'] == 'Moldova', ['population']] = pop_global.loc[pop_global['region'] == 'Republic of Moldova'].squeeze()['population']
-    df['population'] = df['population'] / 100000
-    return df
+    print()
+    print('Transforming data')
+    levels = {level: keys for level, keys in hierarchy.LEVELS.items() if level not in STREAMED_LEVELS}
+    cubes = []
+    for chunk, start in date_chunks(raw, since):
+        cube = rollup(etl('time_series', raw=chunk), levels)
+        cubes.append(cube if not cubes else cube[cube['date'] >= start])
+    return pd.concat(cubes, ignore_index=True)
+
+def county_chunks(raw, since=None):
+    '''
+    builds the county output from the US files a chunk of dates at a time and
+    yields (rows of the chunk's own dates, those dates), so memory is bounded
+    by a chunk of county rows rather than by the history
+    '''
+    # the global files are stood in for by empty tables with the same dates
+    empty = pd.DataFrame(columns=['Province/State', 'Country/Region', 'Lat', 'Long'] + date_columns(raw['confirmed_US']))
+    us_files = {name: raw[name] if name.endswith('_US') else empty for name in TIME_SERIES}
+    for chunk, start in date_chunks(us_files, since):
+        df = view(rollup(etl('time_series', raw=chunk), {'county': hierarchy.LEVELS['county']}), 'us_county')
+        dates = parse_dates(date_columns(chunk['confirmed_US']))
+        yield df[df['date'] >= start], dates[dates >= start]
+
+def publish_counties(raw, since, regions):
+    '''
+    builds the county output a chunk of dates at a time from the US files and
+    writes each chunk to its monthly partitions as soon as it is built.
+    With since, only the dates after the output's own last date are added.
+    Returns the output's part of the regions table, updated.
+    '''
+    print('processing us_county')
+    since = last_date('us_county') if since is not None else None
+    append = since is not None
+    ids = []
+    for df, dates in county_chunks(raw, since):
+        facts, regions = split_regions(df, 'us_county', regions)
+        write_partitions(facts, 'us_county', append=append)
+        ids.append(facts['region_id'].unique())
+        append = True
+    if since is None:
+        # the output was rewritten whole, so regions without facts are gone
+        regions = regions[regions['region_id'].isin(np.concatenate(ids))]
+    return regions
+
+def build_output(name, raw, since, data_key, reference_key):
+    '''
+    builds one processed output as a slice of the cached rolled up data
+    '''
+    cube = memoize('cube', data_key, time_series_cube, raw, since)
+    if isinstance(cube, str):
+        return cube
+    pops = populations(reference_key)
 
-def population_to_china(df, pop_china):
-    df = pd.merge(df, pop_china, left_on='Country/Region', right_on='region', how='left').drop('region', axis=1)
-    df['population'] = df['population'] / 100000
-    return df
+    print('processing {}'.format(name))
+    if name == 'groups':
+        return region_groups(cube, read_groups(), pops)
+    return add_population(view(cube, name), name, pops)
 
-def main(update):
-    data = etl('time_series', 'web', update)
-    if isinstance(data, str):
-        return
-    # dashboard_data.csv is now unused in app.py, no longer need to save
-    # data.to_csv('data/dashboard_data.csv', index=False)
+def output_key(name, data_key, reference_key):
+    return content_hash(data_key, reference_key, name, *[file_hash(path) for path in OUTPUT_FILES.get(name, [])])
+
+def publish_output(name, raw, since, data_key, reference_key, regions):
+    '''
+    builds one output and writes its fact table. regions is the output's part
+    of the regions table; returns the key the output was built from and that
+    part updated with any regions seen for the first time.
+    '''
+    key = output_key(name, data_key, reference_key)
+    if name == 'us_county':
+        return key, publish_counties(shared('raw', data_key), since, regions)  # full historical US county-level data
+        # df = us_county_compressed(raw, memoize('us', output_key('us', data_key, reference_key),  # historical US state-level data
+        #                                        build_output, 'us', raw, since, data_key, reference_key))
+    df = memoize(name, key, build_output, name, raw, since, data_key, reference_key)
+    facts, regions = split_regions(df, name, regions)
+    save_output(facts, name, since)
+    if since is None:
+        # the output was rewritten whole, so regions without facts are gone
+        regions = regions[regions['region_id'].isin(facts['region_id'])]
+    return key, regions
+
+def read_regions():
+    '''
+    returns the region dimension table: one row per region_id with the view
+    (output) it belongs to, its name, the region_id of its parent region or -1,
+    its coordinates and its population in 100,000s
+    '''
+    if output_exists('regions'):
+        return read_output('regions')
+    return pd.DataFrame({'region_id': pd.Series(dtype='int32'),
+                         'view': pd.Series(dtype=object),
+                         'Country/Region': pd.Series(dtype=object),
+                         'parent': pd.Series(dtype='int32'),
+                         'Latitude': pd.Series(dtype='float32'),
+                         'Longitude': pd.Series(dtype='float32'),
+                         'population': pd.Series(dtype='float32')})
+
+def region_attributes(df, columns):
+    return pd.DataFrame({column: df[column].astype(object) if column == 'Country/Region' else df[column].astype('float32')
+                         for column in columns})
+
+def split_regions(df, name, regions):
+    '''
+    splits an output into a fact table which holds region_id in place of the
+    REGION_ATTRIBUTES and the output's part of the regions table. A region is
+    identified by its name within the output, so its id is stable from run to
+    run: the other attributes of known regions are updated in place from their
+    latest rows in df, and names not in regions yet are appended with new ids.
+    '''
+    columns = [column for column in REGION_ATTRIBUTES if column in df]
+    attributes = region_attributes(df, columns).drop_duplicates('Country/Region', keep='last').set_index('Country/Region')
+    names = regions['Country/Region'].astype(object)
+
+    new = pd.Index(df['Country/Region'].astype(object).unique())
+    new = new[~new.isin(names)]
+    first_id = max(OUTPUTS.index(name) * REGION_BLOCK, regions['region_id'].max() + 1 if len(regions) else 0)
+    new = pd.DataFrame({'region_id': np.arange(first_id, first_id + len(new), dtype='int32'),
+                        'view': name, 'Country/Region': new, 'parent': -1})
+    regions = pd.concat([regions, new], ignore_index=True, sort=False)[regions.columns]
+
+    names = regions['Country/Region'].astype(object)
+    updated = names.isin(attributes.index).to_numpy()
+    for column in attributes.columns:
+        regions.loc[updated, column] = attributes[column].reindex(names[updated]).to_numpy()
+
+    ids = pd.Series(regions['region_id'].to_numpy(), index=names).groupby(level=0).min()
+    facts = df.drop(columns=columns).reset_index(drop=True)
+    facts.insert(1, 'region_id', ids.reindex(df['Country/Region'].astype(object)).astype('int32').to_numpy())
+    return facts, regions
+
+def write_regions(regions):
+    '''
+    links every region to its parent region and writes the regions table
+    '''
+    names = regions['Country/Region'].astype(object)
+    parents = pd.DataFrame({'view': regions['view'].astype(object).map({name: parent for name, (level, countries, parent)
+                                                                        in hierarchy.VIEWS.items() if parent}),
+                            'Country/Region': np.select([regions['view'] == 'us',
+                                                         regions['view'] == 'china',
+                                                         regions['view'] == 'us_county'],
+                                                        ['US', 'China', names.str.split(', ').str[-1]],
+                                                        names).astype(object)})
+    ids = regions.assign(view=regions['view'].astype(object), **{'Country/Region': names})[['view', 'Country/Region', 'region_id']]
+    regions = regions.assign(parent=parents.merge(ids, on=['view', 'Country/Region'], how='left')['region_id'].fillna(-1).values)
+    write_output(regions.sort_values('region_id'), 'regions')
+
+def run_stages(stages, dependencies={}):
+    '''
+    runs stages {name: (func, args)} on a pool of forked processes, starting
+    each one as soon as the stages it depends on have finished, and returns
+    {name: result}. Workers inherit the parent's memory, so whatever is already
+    loaded into _memo is shared with them copy-on-write rather than pickled
+    into each one. Without fork the stages run in order in this process.
+    '''
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return {name: func(*args) for name, (func, args) in stages.items()}
+
+    results, running, pending = {}, {}, dict(stages)
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context('fork')) as executor:
+        while pending or running:
+            for name in list(pending):
+                if all(stage in results or stage not in stages for stage in dependencies.get(name, [])):
+                    func, args = pending.pop(name)
+                    running[executor.submit(func, *args)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def output_path(name, partition=None):
+    '''
+    returns the file of an output, or for a partitioned output the file of
+    one partition or, without partition, its manifest
+    '''
+    if name in PARTITIONED_OUTPUTS:
+        return os.path.join('data/df_{}'.format(name), 'manifest.json' if partition is None else '{}.feather'.format(partition))
+    return 'data/df_{}.feather'.format(name)
+
+def output_exists(name):
+    return os.path.exists(output_path(name))
+
+def read_manifest(name):
+    '''
+    returns the partitions of a partitioned output as
+    {month: {'start': date, 'end': date, 'rows': int, 'dates': int}}
+    '''
+    try:
+        with open(output_path(name)) as f:
+            return json.load(f)['partitions']
+    except FileNotFoundError:
+        return {}
 
-    pop_global = global_population()
-    pop_us = us_population()
-    pop_china = china_population(pop_global)
+def read_feather(path, columns=None):
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas(split_blocks=True)
 
-    df_worldwide = worldwide(data)
-    df_worldwide = population_to_worldwide(df_worldwide, pop_global)
-    df_worldwide.to_csv('data/df_worldwide.csv', index=False)
+def write_feather(df, path):
+    '''
+    writes uncompressed Feather (Arrow IPC) in the storage types of
+    schema.compact, which keeps the dates native and the region names
+    dictionary-encoded, and can be memory-mapped by readers.
+    The file is replaced rather than overwritten, since df may still be
+    backed by a mapping of it.
+    '''
+    feather.write_feather(schema.compact(df), path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
 
-    df_us = us(data)
-    df_us = population_to_us(df_us, pop_us)
-    df_us.to_csv('data/df_us.csv', index=False)
+def read_output(name, columns=None, start=None, end=None):
+    '''
+    memory-maps a processed output, keeping the rows dated from start to end
+    when given. Of a partitioned output only the partitions which overlap
+    those dates are opened. The numeric and date columns of an unpartitioned
+    output are used in place rather than copied into memory.
+    '''
+    if name in PARTITIONED_OUTPUTS:
+        months = [month for month, partition in sorted(read_manifest(name).items())
+                  if (start is None or partition['end'] >= start.strftime('%Y-%m-%d'))
+                  and (end is None or partition['start'] <= end.strftime('%Y-%m-%d'))]
+        df = pd.concat([read_feather(output_path(name, month), columns) for month in months], ignore_index=True)
+        if 'Country/Region' in df:
+            df['Country/Region'] = df['Country/Region'].astype('category')
+    else:
+        df = read_feather(output_path(name), columns)
+    if start is not None:
+        df = df[df['date'] >= start]
+    if end is not None:
+        df = df[df['date'] <= end]
+    return df
 
-    df_eu = eu(data)
-    df_eu = population_to_eu(df_eu, pop_global)
-    df_eu.to_csv('data/df_eu.csv', index=False)
+def write_partitions(df, name, append=False):
+    '''
+    writes a partitioned output as one file per month and updates its
+    manifest. With append, the rows are added to their months' partitions and
+    every other partition is left untouched; otherwise the output is replaced.
+    '''
+    os.makedirs(os.path.dirname(output_path(name)), exist_ok=True)
+    partitions = read_manifest(name) if append else {}
+    # only the distinct months are formatted as partition names
+    for month, rows in df.groupby(df['date'].to_numpy().astype('datetime64[M]')):
+        month = pd.Timestamp(month).strftime('%Y-%m')
+        if month in partitions:
+            existing = read_feather(output_path(name, month))
+            rows = pd.concat([existing, rows], ignore_index=True, sort=False)[existing.columns]
+        partitions[month] = write_partition(rows, name, month)
+
+    for stale in glob.glob(output_path(name, '*')):
+        if os.path.basename(stale)[:-len('.feather')] not in partitions:
+            os.remove(stale)
+    write_manifest(partitions, name)
+
+def write_partition(rows, name, month):
+    '''
+    writes the rows of one month of a partitioned output and returns its
+    manifest entry
+    '''
+    write_feather(rows, output_path(name, month))
+    return {'start': rows['date'].min().strftime('%Y-%m-%d'),
+            'end': rows['date'].max().strftime('%Y-%m-%d'),
+            'rows': len(rows),
+            'dates': int(rows['date'].nunique())}
+
+def write_manifest(partitions, name):
+    with open(output_path(name) + '.tmp', 'w') as f:
+        json.dump({'partitions': partitions}, f, indent=2, sort_keys=True)
+    os.replace(output_path(name) + '.tmp', output_path(name))
+
+def write_output(df, name):
+    if name in PARTITIONED_OUTPUTS:
+        write_partitions(df, name)
+    else:
+        write_feather(df, output_path(name))
+
+def last_date(name):
+    '''
+    returns the most recent date in a processed output, or None if it has not
+    been written yet
+    '''
+    if not output_exists(name):
+        return None
+    if name in PARTITIONED_OUTPUTS:
+        return pd.Timestamp(max(partition['end'] for partition in read_manifest(name).values()))
+    return read_output(name, columns=['date'])['date'].max()
 
-    df_china = china(data)
-    df_china = population_to_china(df_china, pop_china)
-    df_china.to_csv('data/df_china.csv', index=False)
+def incremental_since():
+    '''
+    returns the date after which an incremental run adds dates to the outputs
+    built from the cube: the last date of the one lagging furthest behind, as
+    when its stage failed on an earlier run, since each output only appends the
+    dates after its own last date. None, for a full run, if any of them hasn't
+    been written yet. The streamed outputs pick up from their own last dates.
+    '''
+    dates = [last_date(name) for name in OUTPUTS
+             if hierarchy.VIEWS.get(name, ('', None, None))[0] not in STREAMED_LEVELS]
+    return None if any(date is None for date in dates) else min(dates)
 
-    df_us_county = us_county(data)  # full historical US county-level data
-    # df_us_county = us_county_compressed(data, df_us)  # historical US state-level data
-    df_us_county[: int(len(df_us_county) / 4)].to_csv('data/df_us_county1.csv', index=False)
-    df_us_county[int(len(df_us_county) / 4) : 2 * int(len(df_us_county) / 4)].to_csv('data/df_us_county2.csv', index=False)
-    df_us_county[2 * int(len(df_us_county) / 4) : 3 * int(len(df_us_county) / 4)].to_csv('data/df_us_county3.csv', index=False)
-    df_us_county[3 * int(len(df_us_county) / 4) :].to_csv('data/df_us_county4.csv', index=False)
+def save_output(df, name, since=None):
+    '''
+    writes a processed DataFrame to its output. With since, only the rows
+    dated after the output's own last date are added to it, which for a
+    partitioned output rewrites just the newest partitions.
+    '''
+    if since is not None:
+        df = df[df['date'] > last_date(name)]
+        if name in PARTITIONED_OUTPUTS:
+            write_partitions(df, name, append=True)
+            return
+        existing = read_output(name)
+        df = pd.concat([existing, df], ignore_index=True, sort=False)[existing.columns]
+    write_output(df, name)
+
+def main(update, mode='full'):
+    '''
+    mode='incremental' appends only the dates which are newer than the
+    existing outputs and rebuilds only the series whose history was revised,
+    instead of rebuilding everything. Either way data/revisions.json lists the
+    raw rows and output series which changed since the previous run.
+    '''
+    since = incremental_since() if mode == 'incremental' else None
+    raw = download_time_series('web', update)
+    if isinstance(raw, str):
+        return
+    revised, fingerprints = detect_revisions(raw)
+
+    # every stage is keyed on the content of what it reads, so a rerun on
+    # unchanged inputs skips straight past the stages and the file writes
+    code = content_hash(file_hash(__file__), file_hash(schema.__file__), file_hash(hierarchy.__file__))
+    data_key = content_hash(code, raw, since, file_hash('data/aliases.csv'))
+    reference_key = content_hash(code, *[file_hash(path) for path in REFERENCE_FILES], wpp_extract())
+    try:
+        with open(os.path.join(CACHE_DIR, 'outputs.json')) as f:
+            written = json.load(f)
+    except FileNotFoundError:
+        written = {}
+
+    regions = read_regions()
+    stages = {}
+    for name in OUTPUTS:
+        if written.get(name) == output_key(name, data_key, reference_key) and output_exists(name):
+            print('{} unchanged'.format(name))
+        else:
+            stages[name] = (publish_output, (name, None, since, data_key, reference_key, regions[regions['view'] == name]))
+
+    # roll up the shared inputs once before the builders fork, so the workers
+    # find them in _memo and only slice out their views; the streamed county
+    # output reads the raw files, which are shared the same way
+    share('raw', data_key, raw)
+    if stages and not isinstance(memoize('cube', data_key, time_series_cube, raw, since), str):
+        populations(reference_key)
+        for name, (key, view) in run_stages(stages, OUTPUT_DEPENDENCIES).items():
+            written[name] = key
+            regions = pd.concat([regions[regions['view'] != name], view], ignore_index=True)
+
+    if since is not None and len(revised):
+        print('rebuilding {} revised rows'.format(len(revised)))
+        regions = apply_revisions(raw, revised, populations(reference_key), regions)
+    write_regions(regions)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, 'outputs.json'), 'w') as f:
+        json.dump(written, f, indent=2)
+    with open('data/revisions.json', 'w') as f:
+        json.dump({'date': date_columns(raw['confirmed_global'])[-1],
+                   'rows': json.loads(revised.to_json(orient='records')),
+                   'regions': revised_regions(revised)}, f, indent=2)
+    fingerprints.to_csv('data/fingerprints.csv', index=False)
 
 if __name__ == '__main__':
-    if len(sys.argv) == 2:
+    # python etl.py [manual|auto] [full|incremental]
+    if len(sys.argv) == 3:
+        main(update=str(sys.argv[1]), mode=str(sys.argv[2]))
+    elif len(sys.argv) == 2:
         main(update=str(sys.argv[1]))
     else:
         main(update='manual')
\ No newline at end of file
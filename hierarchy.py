@@ -0,0 +1,27 @@
+# The geographic hierarchy the outputs are rolled up along, shared by etl.py
+# and app.py
+
+# Each level is identified by its key columns; a row of the base data belongs
+# to a level if none of the level's keys are missing
+LEVELS = {'county': ['Country/Region', 'Province/State', 'Admin2'],
+          'state': ['Country/Region', 'Province/State'],
+          'country': ['Country/Region']}
+
+EUROPE = ['Albania', 'Andorra', 'Austria', 'Belarus', 'Belgium',
+          'Bosnia and Herzegovina', 'Bulgaria', 'Croatia', 'Cyprus',
+          'Czech Republic', 'Denmark', 'Estonia', 'Finland', 'France',
+          'Germany', 'Greece', 'Hungary', 'Iceland', 'Ireland', 'Italy',
+          'Kosovo', 'Latvia', 'Liechtenstein', 'Lithuania', 'Luxembourg',
+          'Malta', 'Moldova', 'Monaco', 'Montenegro', 'Netherlands',
+          'North Macedonia', 'Norway', 'Poland', 'Portugal', 'Romania',
+          'San Marino', 'Serbia', 'Slovakia', 'Slovenia', 'Spain', 'Sweden',
+          'Switzerland', 'Turkey', 'Ukraine', 'United Kingdom',
+          'Vatican City']
+
+# Each output is a slice of one level: {name: (level, countries or None for
+# all, the output its regions roll up into or None)}
+VIEWS = {'worldwide': ('country', None, None),
+         'us': ('state', ['US'], 'worldwide'),
+         'eu': ('country', EUROPE, 'worldwide'),
+         'china': ('state', ['China'], 'worldwide'),
+         'us_county': ('county', ['US'], 'us')}
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+# Storage types of the processed outputs, shared by etl.py and app.py
+
+IDS = ['region_id', 'parent']  # int32
+NAMES = ['Country/Region', 'view']  # categorical
+COUNTS = ['Confirmed', 'Deaths', 'Recovered', 'Active']  # smallest integer type which holds them
+FRACTIONS = ['Latitude', 'Longitude', 'share_of_last_week', 'population']  # float32
+
+PERCENTAGE_LABELS = np.array(['{:.1f}'.format(tenths / 10) for tenths in range(1001)], dtype=object)
+
+def compact(df):
+    '''
+    casts a processed output to its storage types. Count columns which
+    contain missing values stay float64.
+    '''
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if column in IDS:
+            df[column] = df[column].astype('int32')
+        elif column in NAMES:
+            df[column] = df[column].astype(object).astype('category')
+        elif column in COUNTS:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+        elif column in FRACTIONS:
+            df[column] = df[column].astype('float32')
+    return df
+
+def percentage_labels(values):
+    '''
+    formats share_of_last_week values as the '{:.1f}' labels shown in the
+    app. Values which sit clearly inside a tenth between 0 and 100 are looked
+    up in PERCENTAGE_LABELS; the rare others, halfway cases included, are
+    formatted one by one.
+    '''
+    values = np.asarray(values, dtype='float64')
+    scaled = values * 10
+    tenths = np.rint(scaled)
+    table = (np.abs(scaled - tenths) < 0.499) & (tenths >= 0) & (tenths < len(PERCENTAGE_LABELS))
+    labels = np.empty(len(values), dtype=object)
+    labels[table] = PERCENTAGE_LABELS[tenths[table].astype(np.intp)]
+    labels[~table] = ['{:.1f}'.format(value) for value in values[~table]]
+    return labels